@@ -0,0 +1,538 @@
+#!/usr/bin/env python3
+"""Benchmarks for performance-sensitive parts of news fetcher."""
+import asyncio
+import calendar
+import datetime
+import email.utils
+import json
+import pathlib
+import statistics
+import sys
+import tempfile
+import time
+import timeit
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+import aiohttp.web
+import bs4
+import click
+import tortoise
+from tortoise.expressions import Q
+
+import models
+from client import SessionConfig, SessionFactory
+from db import create_indexes
+from parsers import PARSER_BACKEND_CREATORS, ParserBackend, get_parser_backend
+from rss import (DATETIME_KEY_SUFFIX, ENTRY_DATE_KEYS, entry_to_json_dict,
+                 normalize_entry_dates)
+from utils import check_dict_str_object, check_str, struct_time_to_datetime
+from wikitext import html_to_wikitext
+
+
+def load_corpus(corpus_directory: pathlib.Path) -> List[Tuple[str, str, str]]:
+    """
+    Load corpus of stored web pages.
+
+    Corpus directory should contain `corpus.json` file with list of
+    dictionaries with `file` and `css_selector` keys. Return list of tuples
+    with file name, page text and CSS selector.
+    """
+    with open(corpus_directory.joinpath('corpus.json'), mode='rt') as file:
+        corpus_data = json.load(file)
+    corpus: List[Tuple[str, str, str]] = []
+    for element_data in corpus_data:
+        element = check_dict_str_object(element_data)
+        file_name = check_str(element['file'])
+        with open(
+            corpus_directory.joinpath(file_name), mode='rt', encoding='utf-8'
+        ) as page_file:
+            html = page_file.read()
+        corpus.append((file_name, html, check_str(element['css_selector'])))
+    return corpus
+
+
+def extract_paragraphs(
+    backend: ParserBackend, html: str, css_selector: str
+) -> List[str]:
+    """Extract wiki-text paragraphs like source modules do."""
+    return [
+        html_to_wikitext(paragraph_tag, lambda href: href, backend=backend)
+        for paragraph_tag in backend.select(backend.parse(html), css_selector)
+    ]
+
+
+def html_to_wikitext_recursive(
+    element: bs4.element.PageElement, link_handler: Callable[[str], str],
+    disable_bold_font: bool = False
+) -> str:
+    """
+    Convert HTML element to wiki-text recursively.
+
+    This is previous implementation of `html_to_wikitext` for BeautifulSoup,
+    it is used as reference in benchmarks and tests.
+    """
+    if isinstance(element, bs4.element.NavigableString):
+        return str(element.string)
+    if isinstance(element, bs4.element.Tag):
+        content_str = ''.join(list(map(
+            lambda e:
+            html_to_wikitext_recursive(
+                e, link_handler, disable_bold_font=disable_bold_font
+            ),
+            element.children
+        )))
+        if element.name == 'a':
+            href = str(element.attrs['href'])
+            try:
+                url = link_handler(href)
+            except ValueError:
+                return content_str
+            return f'[{url} {content_str}]'
+        elif (element.name in ('b', 'strong')) and not disable_bold_font:
+            return f"'''{content_str}'''"
+        elif element.name == 'br':
+            return '<br />'
+        elif element.name in ('script', 'img'):
+            return ''
+        else:
+            return content_str
+    else:
+        raise TypeError(element)
+
+
+def generate_large_paragraph(width: int, depth: int) -> str:
+    """
+    Generate HTML paragraph with many inline elements and deep nesting.
+
+    Paragraph contains `width` sentences with links, bold text and line
+    breaks, and then `depth` nested `span` and `b` elements.
+    """
+    sentences = [
+        f'Sentence <b>{index}</b> with <a href="/news/{index}">link</a> '
+        f'and <strong>bold <a href="/tag/{index}">tag</a></strong>.<br>'
+        for index in range(width)
+    ]
+    nested_start = ''.join(
+        '<span>level ' if index % 2 == 0 else '<b>level '
+        for index in range(depth)
+    )
+    nested_end = ''.join(
+        '</span>' if index % 2 == 0 else '</b>'
+        for index in reversed(range(depth))
+    )
+    return f'<p>{"".join(sentences)}{nested_start}{nested_end}</p>'
+
+
+def struct_time_to_local_datetime(
+    value: time.struct_time
+) -> datetime.datetime:
+    """
+    Convert `struct_time` to naive `datetime` through local timestamp.
+
+    This is previous implementation of `struct_time_to_datetime`, it is used
+    as reference in benchmarks. Result depends on local timezone.
+    """
+    return datetime.datetime.fromtimestamp(time.mktime(value))
+
+
+def entry_to_json_dict_with_local_dates(data: Any) -> Dict[str, object]:
+    """
+    Convert feed entry to dictionary converting every parsed date.
+
+    This is previous implementation of `entry_to_json_dict`, it is used as
+    reference in benchmarks.
+    """
+    json_dict = dict(data)
+    for date_key in ENTRY_DATE_KEYS:
+        if date_key + '_parsed' in data:
+            json_dict[date_key + '_parsed'] = struct_time_to_local_datetime(
+                data[date_key + '_parsed']
+            ).isoformat()
+    return json_dict
+
+
+def generate_feed(entry_count: int) -> str:
+    """Generate RSS feed with entries with publication and update dates."""
+    start_timestamp = 1656828671
+    items = [
+        f'<item><title>Title {index}</title>'
+        f'<link>http://localhost/news/{index}</link>'
+        '<pubDate>'
+        f'{email.utils.formatdate(start_timestamp - index * 60)}'
+        '</pubDate><atom:updated>'
+        f'{email.utils.formatdate(start_timestamp - index * 30)}'
+        '</atom:updated></item>'
+        for index in range(entry_count)
+    ]
+    return (
+        '<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom">'
+        f'<channel>{"".join(items)}</channel></rss>'
+    )
+
+
+@click.group()
+def cli() -> None:
+    pass
+
+
+@click.command()
+@click.option(
+    '--corpus-directory', default='data/test/pages',
+    type=click.Path(exists=True, dir_okay=True, file_okay=False),
+    help='Directory with stored web pages and corpus.json file'
+)
+@click.option(
+    '--repeat', type=click.IntRange(min=1), default=100,
+    help='Number of times to parse each page'
+)
+def parser_backends(corpus_directory: str, repeat: int) -> None:
+    """
+    Compare HTML parser backends on corpus of stored web pages.
+
+    Wiki-text produced by every backend is compared with wiki-text produced
+    by default backend, command fails if there are differences.
+    """
+    corpus = load_corpus(pathlib.Path(corpus_directory))
+    reference_backend = get_parser_backend('html.parser')
+    reference_results: Dict[str, List[str]] = {
+        file_name: extract_paragraphs(reference_backend, html, css_selector)
+        for file_name, html, css_selector in corpus
+    }
+
+    mismatches = 0
+    for backend_name in PARSER_BACKEND_CREATORS:
+        try:
+            backend = get_parser_backend(backend_name)
+            for file_name, html, css_selector in corpus:
+                result = extract_paragraphs(backend, html, css_selector)
+                if result != reference_results[file_name]:
+                    mismatches += 1
+                    click.echo(
+                        f'{backend_name}: different wiki-text for '
+                        f'{file_name}', err=True
+                    )
+        except Exception as exc:  # noqa: B902
+            click.echo(f'{backend_name}: not available ({exc})', err=True)
+            continue
+        time = timeit.timeit(
+            lambda: [
+                extract_paragraphs(backend, html, css_selector)
+                for _, html, css_selector in corpus
+            ],
+            number=repeat
+        )
+        click.echo(
+            f'{backend_name}: {time:.3f} s, '
+            f'{time * 1000 / repeat / len(corpus):.3f} ms per page'
+        )
+
+    if mismatches != 0:
+        raise click.ClickException(f'{mismatches} mismatches found')
+
+
+@click.command()
+@click.option(
+    '--width', type=click.IntRange(min=1), default=5000,
+    help='Number of sentences in generated paragraph'
+)
+@click.option(
+    '--depth', type=click.IntRange(min=1), default=200,
+    help='Nesting depth of elements in generated paragraph'
+)
+@click.option(
+    '--repeat', type=click.IntRange(min=1), default=10,
+    help='Number of times to convert paragraph'
+)
+def wikitext(width: int, depth: int, repeat: int) -> None:
+    """Compare iterative and recursive wiki-text conversion."""
+    backend = get_parser_backend('html.parser')
+    paragraph = backend.select(
+        backend.parse(generate_large_paragraph(width, depth)), 'p'
+    )[0]
+
+    result = html_to_wikitext(paragraph, lambda href: href)
+    time = timeit.timeit(
+        lambda: html_to_wikitext(paragraph, lambda href: href),
+        number=repeat
+    )
+    click.echo(f'iterative: {time * 1000 / repeat:.3f} ms per paragraph')
+
+    try:
+        reference_result = html_to_wikitext_recursive(
+            paragraph, lambda href: href
+        )
+    except RecursionError:
+        click.echo(
+            f'recursive: recursion limit {sys.getrecursionlimit()} exceeded'
+        )
+        return
+    if reference_result != result:
+        raise click.ClickException('Different wiki-text')
+    time = timeit.timeit(
+        lambda: html_to_wikitext_recursive(paragraph, lambda href: href),
+        number=repeat
+    )
+    click.echo(f'recursive: {time * 1000 / repeat:.3f} ms per paragraph')
+
+
+async def fill_synthetic_article_table(row_count: int) -> None:
+    """
+    Fill database with synthetic articles from 10 sources.
+
+    Every 100th article is not fetched yet, every 100th article is not
+    uploaded yet, every 10th article has tag.
+    """
+    connection = tortoise.Tortoise.get_connection('default')
+    await connection.execute_script('''
+        WITH RECURSIVE s(value) AS (
+            SELECT 0 UNION ALL SELECT value + 1 FROM s WHERE value < 9
+        )
+        INSERT INTO source (slug_name) SELECT 'source-' || value FROM s;
+        INSERT INTO tag (title) VALUES ('Tag');
+    ''')
+    await connection.execute_script(f'''
+        WITH RECURSIVE s(value) AS (
+            SELECT 1 UNION ALL SELECT value + 1 FROM s
+            WHERE value < {row_count}
+        )
+        INSERT INTO article (
+            source_id, slug_name, title, date, source_url, source_url_ok,
+            wikitext_paragraphs, misc_data, uploaded
+        )
+        SELECT
+            'source-' || (value % 10), 'news-' || value, 'Title ' || value,
+            '2022-07-03T06:11:11+00:00', 'http://localhost/news/' || value,
+            CASE WHEN value % 100 = 0 THEN NULL ELSE 1 END,
+            CASE WHEN value % 100 = 0 THEN NULL ELSE '["Text."]' END,
+            '{{}}',
+            CASE WHEN value % 100 = 1 THEN 0 ELSE 1 END
+        FROM s;
+        INSERT INTO article_m2m_tag (article_id, tag_id)
+        SELECT article_id, 1 FROM article WHERE article_id % 10 = 1;
+    ''')
+
+
+def get_pipeline_queries(
+    source: models.Source
+) -> Dict[str, Callable[[], Awaitable[object]]]:
+    """Get queries which are used by pipeline stages."""
+    not_generated_filter = ~Q(wikitext_paragraphs=None) & Q(uploaded=False)
+    return {
+        'fetch-news-pages: articles': lambda: source.articles.filter(
+            Q(wikitext_paragraphs=None) & (
+                Q(source_url_ok=1) | Q(source_url_ok=None)
+            )
+        ).values_list('article_id'),
+        'generate-wiki-pages: count': lambda: source.articles.filter(
+            not_generated_filter
+        ).count(),
+        'generate-wiki-pages: chunk': lambda: source.articles.filter(
+            not_generated_filter
+        ).order_by('article_id').limit(500).values_list('article_id'),
+        'generate-wiki-pages: tags': lambda: models.ArticleTag.filter(
+            article_id__gte=500000, article_id__lte=505000
+        ).values_list('article_id', 'tag_id'),
+        'mark-uploaded-pages': lambda: source.articles.filter(
+            slug_name__in=[f'news-{index}' for index in range(1, 500)]
+        ).values_list('article_id'),
+    }
+
+
+async def benchmark_queries(
+    queries: Dict[str, Callable[[], Awaitable[object]]], repeat: int
+) -> Dict[str, float]:
+    """Return median execution time for every query."""
+    times: Dict[str, float] = {}
+    for name, query in queries.items():
+        query_times: List[float] = []
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            await query()
+            query_times.append(time.perf_counter() - start_time)
+        times[name] = statistics.median(query_times)
+    return times
+
+
+async def db_indexes_async(row_count: int, repeat: int) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        await tortoise.Tortoise.init(
+            db_url=f'sqlite://{directory}/benchmark.sqlite3',
+            modules={'models': ['models']}
+        )
+        try:
+            await tortoise.Tortoise.generate_schemas()
+            click.echo(f'Creating {row_count} articles...', err=True)
+            await fill_synthetic_article_table(row_count)
+            queries = get_pipeline_queries(
+                await models.Source.get(slug_name='source-1')
+            )
+
+            times_without_indexes = await benchmark_queries(queries, repeat)
+            await create_indexes()
+            await tortoise.Tortoise.get_connection('default').execute_script(
+                'ANALYZE'
+            )
+            times_with_indexes = await benchmark_queries(queries, repeat)
+        finally:
+            await tortoise.connection.connections.close_all(discard=True)
+
+    for name in queries:
+        click.echo(
+            f'{name}: {times_without_indexes[name] * 1000:.3f} ms without '
+            f'indexes, {times_with_indexes[name] * 1000:.3f} ms with indexes'
+        )
+
+
+@click.command()
+@click.option(
+    '--rows', type=click.IntRange(min=1), default=1000000,
+    help='Number of articles in synthetic table'
+)
+@click.option(
+    '--repeat', type=click.IntRange(min=1), default=5,
+    help='Number of times to run each query'
+)
+def db_indexes(rows: int, repeat: int) -> None:
+    """Compare query time without and with indexes on SQLite database."""
+    asyncio.run(db_indexes_async(rows, repeat))
+
+
+async def run_requests(
+    session_factory: SessionFactory, url: str, request_count: int,
+    concurrency: int
+) -> float:
+    """Make requests with concurrency, return total time in seconds."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def make_request(session: aiohttp.ClientSession) -> None:
+        async with semaphore:
+            async with session.get(url) as response:
+                await response.read()
+
+    start_time = time.perf_counter()
+    async with session_factory.create_session(concurrency) as session:
+        await asyncio.gather(*[
+            make_request(session) for _ in range(request_count)
+        ])
+    return time.perf_counter() - start_time
+
+
+async def connection_reuse_async(
+    request_count: int, concurrency: int, page_size: int
+) -> None:
+    page = 'x' * page_size
+
+    async def get_page(_request: aiohttp.web.Request) -> aiohttp.web.Response:
+        return aiohttp.web.Response(text=page)
+
+    app = aiohttp.web.Application()
+    app.router.add_route('GET', '/', get_page)
+    runner = aiohttp.web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        site = aiohttp.web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        assert runner.addresses
+        host, port = runner.addresses[0][:2]
+        url = f'http://{host}:{port}/'
+        configs = {
+            'new connection per request': SessionConfig(force_close=True),
+            'reused connections': SessionConfig(),
+        }
+        for name, config in configs.items():
+            time = await run_requests(
+                SessionFactory(config), url, request_count, concurrency
+            )
+            click.echo(
+                f'{name}: {time:.3f} s, '
+                f'{request_count / time:.1f} requests per second'
+            )
+    finally:
+        await runner.cleanup()
+
+
+@click.command()
+@click.option(
+    '--requests', type=click.IntRange(min=1), default=2000,
+    help='Number of requests to local server'
+)
+@click.option(
+    '--concurrency', type=click.IntRange(min=1), default=4,
+    help='Maximum number of concurrent requests'
+)
+@click.option(
+    '--page-size', type=click.IntRange(min=0), default=50000,
+    help='Size of response body in bytes'
+)
+def connection_reuse(requests: int, concurrency: int, page_size: int) -> None:
+    """Compare HTTP sessions with and without connection reuse."""
+    asyncio.run(connection_reuse_async(requests, concurrency, page_size))
+
+
+@click.command()
+@click.option(
+    '--entries', type=click.IntRange(min=1), default=10000,
+    help='Number of entries in generated feed'
+)
+@click.option(
+    '--repeat', type=click.IntRange(min=1), default=5,
+    help='Number of times to convert dates of all entries'
+)
+def rss_dates(entries: int, repeat: int) -> None:
+    """
+    Compare date conversion of feed entries with previous implementation.
+
+    Time of saving article date and JSON dictionary of entry is measured.
+    """
+    import feedparser
+    click.echo(f'Parsing feed with {entries} entries...', err=True)
+    feed_entries = feedparser.parse(generate_feed(entries)).entries
+
+    def convert_with_local_dates() -> None:
+        for entry in feed_entries:
+            struct_time_to_local_datetime(entry.published_parsed)
+            entry_to_json_dict_with_local_dates(entry)
+
+    def convert_with_cached_dates() -> None:
+        normalize_entry_dates(feed_entries)
+        for entry in feed_entries:
+            entry.get('published' + DATETIME_KEY_SUFFIX)
+            entry_to_json_dict(entry)
+
+    def clear_cached_dates() -> None:
+        for entry in feed_entries:
+            for date_key in ENTRY_DATE_KEYS:
+                entry.pop(date_key + DATETIME_KEY_SUFFIX, None)
+
+    for entry in feed_entries:
+        expected_date = datetime.datetime.fromtimestamp(
+            calendar.timegm(entry.published_parsed), datetime.timezone.utc
+        )
+        if struct_time_to_datetime(entry.published_parsed) != expected_date:
+            raise click.ClickException('Different dates')
+
+    for name, function in (
+        ('previous', convert_with_local_dates),
+        ('cached', convert_with_cached_dates),
+    ):
+        times: List[float] = []
+        for _ in range(repeat):
+            clear_cached_dates()
+            start_time = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start_time)
+        click.echo(
+            f'{name}: {statistics.median(times) * 1000:.3f} ms for '
+            f'{entries} entries'
+        )
+
+
+cli.add_command(parser_backends)
+cli.add_command(wikitext)
+cli.add_command(db_indexes)
+cli.add_command(connection_reuse)
+cli.add_command(rss_dates)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,333 @@
+"""HTTP client helpers: sessions, retries and per-host rate limiting."""
+import asyncio
+import dataclasses
+import email.utils
+import random
+import time
+import types
+from typing import Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+
+import aiohttp
+
+# Statuses which mean that server asks to send requests less often
+THROTTLED_STATUSES = (429, 503)
+
+T = TypeVar('T')
+
+
+class HTTPStatusError(ValueError):
+    """Error which is raised if server responds with unexpected status."""
+
+    status: int
+
+    def __init__(self, status: int):
+        super().__init__(status)
+        self.status = status
+
+
+# Errors of request which do not mean that there is error in code
+REQUEST_ERRORS = (HTTPStatusError, aiohttp.ClientError, asyncio.TimeoutError)
+
+
+def is_transient_status(status: int) -> bool:
+    """Check if request with response status can succeed later."""
+    return (status in THROTTLED_STATUSES) or (status >= 500)
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """
+    Check if request can succeed if it is sent again.
+
+    Connection errors, timeouts, server errors and throttled responses are
+    transient, invalid URLs are not.
+    """
+    if isinstance(exc, HTTPStatusError):
+        return is_transient_status(exc.status)
+    if isinstance(exc, aiohttp.InvalidURL):
+        return False
+    return isinstance(exc, REQUEST_ERRORS)
+
+
+@dataclasses.dataclass
+class RetryPolicy:
+    """
+    Policy to retry requests which failed with transient errors.
+
+    Request is made no more than `attempts` times. Delay before retry is
+    random between 0 and `base_delay * 2 ** retry_index` seconds (but no more
+    than `max_delay`), so that concurrent requests failed at the same time
+    are not retried at the same time.
+    """
+
+    attempts: int = 3
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+    def get_delay(self, retry_index: int) -> float:
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** retry_index)
+        )
+
+    async def run(self, function: Callable[[], Awaitable[T]]) -> T:
+        """Call coroutine function, call it again on transient errors."""
+        for retry_index in range(self.attempts - 1):
+            try:
+                return await function()
+            except Exception as exc:  # noqa: B902
+                if not is_transient_error(exc):
+                    raise
+            await asyncio.sleep(self.get_delay(retry_index))
+        return await function()
+
+
+NO_RETRY_POLICY = RetryPolicy(attempts=1)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse `Retry-After` header value to delay in seconds.
+
+    Value can be number of seconds or HTTP date. Return `None` if value is
+    missing or invalid.
+    """
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        return None
+    return max(0.0, date.timestamp() - time.time())
+
+
+@dataclasses.dataclass
+class HostState:
+    """Token bucket state of one host."""
+
+    rate: float
+    tokens: float
+    updated_at: float
+    paused_until: float = 0.0
+
+
+class HostRateLimiter:
+    """
+    Scheduler which limits request rate to every host with token bucket.
+
+    Every host (scheme, host name and port) starts with `initial_rate`
+    requests per second. Rate is increased by `rate_step` after every
+    successful response up to `max_rate`, and it is multiplied by
+    `backoff_factor` (down to `min_rate`) after every 429 or 503 response.
+    Requests to host are paused for time from `Retry-After` header of such
+    response (no more than `max_pause` seconds), or for one request interval
+    if header is missing. Up to `burst` requests can be sent at once after
+    host was idle.
+
+    Limiter is attached to sessions with trace config, see
+    `SessionFactory`, so all requests of sessions are scheduled by it.
+    """
+
+    initial_rate: float
+    min_rate: float
+    max_rate: float
+    rate_step: float
+    backoff_factor: float
+    burst: float
+    max_pause: float
+    hosts: Dict[str, HostState]
+
+    def __init__(
+        self, initial_rate: float = 4.0, min_rate: float = 0.1,
+        max_rate: float = 50.0, rate_step: float = 0.5,
+        backoff_factor: float = 0.5, burst: float = 1.0,
+        max_pause: float = 600.0
+    ):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_step = rate_step
+        self.backoff_factor = backoff_factor
+        self.burst = burst
+        self.max_pause = max_pause
+        self.hosts = {}
+
+    def get_host_state(self, host: str) -> HostState:
+        if host not in self.hosts:
+            self.hosts[host] = HostState(
+                self.initial_rate, self.burst, time.monotonic()
+            )
+        return self.hosts[host]
+
+    def get_rate(self, host: str) -> float:
+        """Return current rate of host in requests per second."""
+        return self.get_host_state(host).rate
+
+    async def acquire(self, host: str) -> None:
+        """Wait until request to host can be sent."""
+        state = self.get_host_state(host)
+        while True:
+            now = time.monotonic()
+            if now < state.paused_until:
+                await asyncio.sleep(state.paused_until - now)
+                continue
+            state.tokens = min(
+                self.burst,
+                state.tokens + (now - state.updated_at) * state.rate
+            )
+            state.updated_at = now
+            if state.tokens >= 1:
+                state.tokens -= 1
+                return
+            await asyncio.sleep((1 - state.tokens) / state.rate)
+
+    def report_response(
+        self, host: str, status: int, retry_after: Optional[float] = None
+    ) -> None:
+        """Adapt rate of host to response status."""
+        state = self.get_host_state(host)
+        if status in THROTTLED_STATUSES:
+            state.rate = max(self.min_rate, state.rate * self.backoff_factor)
+            pause = 1 / state.rate if retry_after is None else retry_after
+            state.paused_until = max(
+                state.paused_until,
+                time.monotonic() + min(pause, self.max_pause)
+            )
+            state.tokens = 0
+        elif status < 400:
+            state.rate = min(self.max_rate, state.rate + self.rate_step)
+
+    async def on_request_start(
+        self, _session: aiohttp.ClientSession,
+        _context: types.SimpleNamespace,
+        params: aiohttp.TraceRequestStartParams
+    ) -> None:
+        await self.acquire(str(params.url.origin()))
+
+    async def on_request_end(
+        self, _session: aiohttp.ClientSession,
+        _context: types.SimpleNamespace,
+        params: aiohttp.TraceRequestEndParams
+    ) -> None:
+        self.report_response(
+            str(params.url.origin()), params.response.status,
+            parse_retry_after(params.response.headers.get('Retry-After'))
+        )
+
+    def create_trace_config(self) -> aiohttp.TraceConfig:
+        """Create trace config which schedules requests of session."""
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self.on_request_start)
+        trace_config.on_request_end.append(self.on_request_end)
+        return trace_config
+
+
+# Types of values which are allowed for every `SessionConfig` field in JSON
+SESSION_CONFIG_JSON_TYPES: Dict[str, Tuple[type, ...]] = {
+    'limit': (int,),
+    'limit_per_host': (int,),
+    'dns_cache_ttl': (int, type(None)),
+    'keepalive_timeout': (int, float),
+    'force_close': (bool,),
+    'total_timeout': (int, float, type(None)),
+    'connect_timeout': (int, float, type(None)),
+    'read_timeout': (int, float, type(None)),
+    'accept_encoding': (str, type(None)),
+}
+
+
+@dataclasses.dataclass
+class SessionConfig:
+    """
+    Configuration of HTTP sessions.
+
+    `limit` and `limit_per_host` are maximum numbers of connections (0 means
+    no limit). Resolved host addresses are cached for `dns_cache_ttl` seconds
+    (`None` means forever). Idle connections are kept open for
+    `keepalive_timeout` seconds to be reused, unless `force_close` is `True`.
+    Timeouts are in seconds, `None` means no timeout. If `accept_encoding` is
+    `None`, default `Accept-Encoding` header of aiohttp is sent.
+    """
+
+    limit: int = 100
+    limit_per_host: int = 4
+    dns_cache_ttl: Optional[int] = 300
+    keepalive_timeout: float = 30.0
+    force_close: bool = False
+    total_timeout: Optional[float] = 300.0
+    connect_timeout: Optional[float] = 30.0
+    read_timeout: Optional[float] = 60.0
+    accept_encoding: Optional[str] = 'gzip, deflate'
+
+    @classmethod
+    def from_json_dict(cls, data: Dict[str, object]) -> 'SessionConfig':
+        """Create config from dictionary, raise `ValueError` on error."""
+        for key, value in data.items():
+            if key not in SESSION_CONFIG_JSON_TYPES:
+                raise ValueError(f'Unknown session option {key}')
+            allowed_types = SESSION_CONFIG_JSON_TYPES[key]
+            if (
+                not isinstance(value, allowed_types)
+                or (isinstance(value, bool) and (bool not in allowed_types))
+            ):
+                raise ValueError(f'Invalid value of session option {key}')
+        return cls(**data)  # type: ignore
+
+
+class SessionFactory:
+    """
+    Factory of HTTP sessions which are used by commands and source modules.
+
+    Sessions are created with `config`. If `rate_limiter` is specified, all
+    requests of all sessions are scheduled by it.
+    """
+
+    config: SessionConfig
+    rate_limiter: Optional[HostRateLimiter]
+
+    def __init__(
+        self, config: Optional[SessionConfig] = None,
+        rate_limiter: Optional[HostRateLimiter] = None
+    ):
+        self.config = config or SessionConfig()
+        self.rate_limiter = rate_limiter
+
+    def create_session(
+        self, limit_per_host: Optional[int] = None
+    ) -> aiohttp.ClientSession:
+        """
+        Create HTTP session.
+
+        `limit_per_host` overrides value from config if it is not `None`.
+        """
+        config = self.config
+        headers: Dict[str, str] = {}
+        if config.accept_encoding is not None:
+            headers['Accept-Encoding'] = config.accept_encoding
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=config.limit,
+                limit_per_host=(
+                    config.limit_per_host if limit_per_host is None
+                    else limit_per_host
+                ),
+                use_dns_cache=True, ttl_dns_cache=config.dns_cache_ttl,
+                keepalive_timeout=(
+                    None if config.force_close else config.keepalive_timeout
+                ),
+                force_close=config.force_close
+            ),
+            timeout=aiohttp.ClientTimeout(
+                total=config.total_timeout, connect=config.connect_timeout,
+                sock_read=config.read_timeout
+            ),
+            headers=headers,
+            trace_configs=(
+                [] if self.rate_limiter is None
+                else [self.rate_limiter.create_trace_config()]
+            )
+        )
@@ -0,0 +1,38 @@
+"""Concurrency helpers."""
+import asyncio
+import collections
+from typing import (AsyncGenerator, Awaitable, Callable, Deque, Iterable,
+                    TypeVar)
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+async def map_ordered(
+    function: Callable[[T], Awaitable[R]], items: Iterable[T],
+    concurrency: int
+) -> AsyncGenerator[R, None]:
+    """
+    Call `function` for items concurrently and iterate over results in order.
+
+    No more than `concurrency` calls are running at the same time, and no more
+    than `2 * concurrency` finished results are kept waiting for the earlier
+    ones.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item: T) -> R:
+        async with semaphore:
+            return await function(item)
+
+    pending: Deque['asyncio.Future[R]'] = collections.deque()
+    try:
+        for item in items:
+            pending.append(asyncio.ensure_future(run(item)))
+            if len(pending) >= 2 * concurrency:
+                yield await pending.popleft()
+        while len(pending) != 0:
+            yield await pending.popleft()
+    finally:
+        for future in pending:
+            future.cancel()
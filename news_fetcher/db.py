@@ -1,13 +1,164 @@
 """Database common functions."""
 import os
-from typing import Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
 
 import tortoise
+from tortoise.queryset import QuerySet
 
+import models
 
-async def init_db(db_url: Optional[str] = None) -> None:
+# Version of DB schema which is created by `migrate_db`, it should be
+# increased when models or indexes are changed
+SCHEMA_VERSION = 3
+
+# Indexes which can not be declared in models: partial indexes and indexes
+# on many-to-many table. Every index is tuple with name, table name,
+# column names and condition for partial index (with `{false}` placeholder
+# for dialect-specific false value).
+INDEXES: List[Tuple[str, str, str, Optional[str]]] = [
+    (
+        'idx_article_not_fetched', 'article', 'source_id, article_id',
+        'wikitext_paragraphs IS NULL'
+    ),
+    (
+        'idx_article_not_uploaded', 'article', 'source_id, article_id',
+        'uploaded = {false}'
+    ),
+    ('idx_article_m2m_tag_article', 'article_m2m_tag', 'article_id', None),
+]
+
+
+def get_index_sql(
+    name: str, table: str, columns: str, condition: Optional[str],
+    dialect: str
+) -> str:
+    """Get SQL statement to create index if it does not exist."""
+    sql = f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})'
+    if condition is not None:
+        false_value = 'false' if dialect == 'postgres' else '0'
+        sql += ' WHERE ' + condition.format(false=false_value)
+    return sql
+
+
+async def create_indexes() -> None:
+    """Create indexes from `INDEXES` list which do not exist yet."""
+    connection = tortoise.Tortoise.get_connection('default')
+    for name, table, columns, condition in INDEXES:
+        await connection.execute_script(get_index_sql(
+            name, table, columns, condition, connection.capabilities.dialect
+        ))
+
+
+async def get_schema_version() -> Optional[int]:
+    """Get DB schema version, or `None` if DB is not initialized."""
+    try:
+        schema_version = await models.SchemaVersion.first()
+    except tortoise.exceptions.OperationalError:
+        return None
+    if schema_version is None:
+        return None
+    return schema_version.version
+
+
+async def migrate_db() -> Optional[int]:
+    """
+    Create missing tables and indexes and save schema version.
+
+    Existing tables are not changed. Nothing is done if schema version is
+    current. Return previous schema version.
+    """
+    old_version = await get_schema_version()
+    if old_version == SCHEMA_VERSION:
+        return old_version
+    await tortoise.Tortoise.generate_schemas(safe=True)
+    await create_indexes()
+    async with tortoise.transactions.in_transaction():
+        await models.SchemaVersion.all().delete()
+        await models.SchemaVersion.create(version=SCHEMA_VERSION)
+    return old_version
+
+
+async def init_db(
+    db_url: Optional[str] = None, check_version: bool = True
+) -> None:
+    """
+    Connect to DB and check its schema version.
+
+    Raise `ValueError` if schema version is not current. Schema is not
+    created or updated, use `migrate_db` to do it.
+    """
     await tortoise.Tortoise.init(
         db_url=db_url or os.getenv('DATABASE_URL'),
         modules={'models': ['models']}
     )
-    await tortoise.Tortoise.generate_schemas()
+    if not check_version:
+        return
+    version = await get_schema_version()
+    if version is None:
+        raise ValueError('DB is not initialized, run `init-db` command')
+    if version != SCHEMA_VERSION:
+        raise ValueError(
+            f'DB schema version is {version}, but {SCHEMA_VERSION} is '
+            'required, run `init-db` command'
+        )
+
+
+async def iterate_article_value_chunks(
+    query: 'QuerySet[Any]', field_names: Sequence[str], chunk_size: int
+) -> AsyncIterator[List[Tuple[Any, ...]]]:
+    """
+    Iterate over chunks of tuples with article fields from query.
+
+    First field should be `article_id`. Articles are ordered by ID and
+    loaded from database chunk by chunk, next chunk starts after last ID of
+    previous chunk, so articles changed during iteration are not skipped.
+    """
+    last_article_id: Optional[int] = None
+    while True:
+        chunk_query = query
+        if last_article_id is not None:
+            chunk_query = chunk_query.filter(article_id__gt=last_article_id)
+        values = await chunk_query.order_by('article_id').limit(
+            chunk_size
+        ).values_list(*field_names)
+        if len(values) != 0:
+            yield values
+        if len(values) < chunk_size:
+            return
+        last_article_id = values[-1][0]
+
+
+async def iterate_raw_article_chunks(
+    source_slug_name: str, column_names: Sequence[str], chunk_size: int
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Iterate over chunks of source articles with column values as in DB.
+
+    Values are not converted by model fields, so stored JSON text can be
+    read. Articles are loaded in chunks ordered by ID like in
+    `iterate_article_value_chunks`.
+    """
+    connection = tortoise.Tortoise.get_connection('default')
+    placeholders = (
+        ('$1', '$2') if connection.capabilities.dialect == 'postgres'
+        else ('?', '?')
+    )
+    columns = ', '.join(
+        f'"{column_name}"' for column_name in ['article_id', *column_names]
+    )
+    sql = (
+        f'SELECT {columns} FROM "{models.Article._meta.db_table}" '
+        f'WHERE "source_id" = {placeholders[0]} '
+        f'AND "article_id" > {placeholders[1]} '
+        f'ORDER BY "article_id" LIMIT {int(chunk_size)}'
+    )
+    last_article_id = 0
+    while True:
+        rows = await connection.execute_query_dict(
+            sql, [source_slug_name, last_article_id]
+        )
+        if len(rows) != 0:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        last_article_id = rows[-1]['article_id']
@@ -0,0 +1,96 @@
+"""Compact JSON encoding of article fields in DB."""
+import base64
+import json
+import zlib
+from typing import Any, Union
+
+# Compression methods of JSON values, `zstd` requires `zstandard` package
+COMPRESSION_METHODS = ('none', 'zlib', 'zstd')
+
+
+def dump_json(value: Any) -> str:
+    """Dump value to JSON without whitespace and escaped characters."""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def compress(data: bytes, method: str) -> bytes:
+    """Compress data, raise `ValueError` if method is not available."""
+    if method == 'zlib':
+        return zlib.compress(data, 9)
+    if method == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError('zstandard is not installed')
+        compressed_data: bytes = zstandard.ZstdCompressor(
+            level=19
+        ).compress(data)
+        return compressed_data
+    raise ValueError(f'Invalid compression method {method}')
+
+
+def decompress(data: bytes, method: str) -> bytes:
+    """Decompress data, raise `ValueError` if method is not available."""
+    if method == 'zlib':
+        return zlib.decompress(data)
+    if method == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError('zstandard is not installed')
+        decompressed_data: bytes = zstandard.ZstdDecompressor().decompress(
+            data
+        )
+        return decompressed_data
+    raise ValueError(f'Invalid compression method {method}')
+
+
+class JSONCodec:
+    """
+    Encoder and decoder of JSON field which can compress values.
+
+    If `compression` is not `none`, value is stored as JSON string with
+    compression method name and base64-encoded compressed JSON, separated by
+    colon, if it is shorter than plain JSON. Values which are stored as
+    strings can not be encoded. Plain and compressed values are decoded
+    transparently, so compression can be changed at any time.
+    """
+
+    compression: str
+
+    def __init__(self, compression: str = 'none'):
+        self.compression = compression
+
+    def set_compression(self, compression: str) -> None:
+        """Set compression method, raise `ValueError` if it is invalid."""
+        if compression not in COMPRESSION_METHODS:
+            raise ValueError(f'Invalid compression method {compression}')
+        if compression != 'none':
+            compress(b'', compression)
+        self.compression = compression
+
+    def encode(self, value: Any) -> str:
+        if isinstance(value, str):
+            raise ValueError('String value can not be encoded')
+        text = dump_json(value)
+        if self.compression == 'none':
+            return text
+        data = base64.b64encode(
+            compress(text.encode('utf-8'), self.compression)
+        ).decode('ascii')
+        compressed_text = dump_json(f'{self.compression}:{data}')
+        if len(compressed_text) >= len(text.encode('utf-8')):
+            return text
+        return compressed_text
+
+    def decode(self, text: Union[str, bytes]) -> Any:
+        value = json.loads(text)
+        if not isinstance(value, str):
+            return value
+        method, _, data = value.partition(':')
+        return json.loads(decompress(base64.b64decode(data), method))
+
+
+# Codec of wiki-text paragraphs of articles, compression is set by
+# command line option
+PARAGRAPHS_CODEC = JSONCodec()
@@ -1,10 +1,16 @@
 """Database models."""
+import datetime
+from typing import Any, List, Optional, Union
+
 from tortoise import fields
 from tortoise.models import Model
 
+from json_codec import PARAGRAPHS_CODEC, dump_json
+
 
 class Source(Model):
     slug_name = fields.CharField(max_length=126, pk=True)
+    articles: 'fields.ReverseRelation[Article]'
 
     def __str__(self) -> str:
         return self.slug_name
@@ -45,8 +51,11 @@ class Article(Model):
     source_url_ok = fields.BooleanField(null=True)
 
     author_name = fields.TextField(null=True)
-    wikitext_paragraphs = fields.JSONField(null=True)
-    misc_data = fields.JSONField()
+    wikitext_paragraphs = fields.JSONField(
+        null=True, encoder=PARAGRAPHS_CODEC.encode,
+        decoder=PARAGRAPHS_CODEC.decode
+    )
+    misc_data = fields.JSONField(encoder=dump_json)
     tags: 'fields.relational.ManyToManyRelation[Tag]' = (
         fields.ManyToManyField(
             'models.Tag', related_name='articles', through='article_m2m_tag'
@@ -60,3 +69,134 @@ class Article(Model):
 
     class Meta:
         unique_together = ('source', 'slug_name')
+
+
+class GeneratedPage(Model):
+    article: 'fields.relational.OneToOneRelation[Article]' = (
+        fields.OneToOneField('models.Article', related_name='generated_page')
+    )
+    article_id: int
+    content_hash = fields.CharField(max_length=64)
+
+    def __str__(self) -> str:
+        return f'{self.article_id}:{self.content_hash}'
+
+
+class FeedCache(Model):
+    feed_cache_id = fields.IntField(pk=True)
+    source: 'fields.relational.ForeignKeyRelation[Source]' = (
+        fields.ForeignKeyField('models.Source', related_name='feed_caches')
+    )
+    url = fields.CharField(max_length=2047)
+    etag = fields.TextField(null=True)
+    last_modified = fields.TextField(null=True)
+    content_hash = fields.CharField(max_length=64)
+
+    def __str__(self) -> str:
+        return f'{self.url}:{self.content_hash}'
+
+    class Meta:
+        unique_together = ('source', 'url')
+
+
+class CompletedPage(Model):
+    completed_page_id = fields.IntField(pk=True)
+    source: 'fields.relational.ForeignKeyRelation[Source]' = (
+        fields.ForeignKeyField('models.Source', related_name='completed_pages')
+    )
+    command = fields.CharField(max_length=255)
+    page = fields.IntField()
+
+    def __str__(self) -> str:
+        return f'{self.command}:{self.page}'
+
+    class Meta:
+        unique_together = ('source', 'command', 'page')
+
+
+class StoredPage(Model):
+    article: 'fields.relational.OneToOneRelation[Article]' = (
+        fields.OneToOneField('models.Article', related_name='stored_page')
+    )
+    article_id: int
+    content_hash = fields.CharField(max_length=64, index=True)
+
+    def __str__(self) -> str:
+        return f'{self.article_id}:{self.content_hash}'
+
+
+class SchemaVersion(Model):
+    schema_version_id = fields.IntField(pk=True)
+    version = fields.IntField()
+
+    def __str__(self) -> str:
+        return str(self.version)
+
+
+class ArticleFetchRow:
+    """Article fields used to fetch article page, without model overhead."""
+
+    __slots__ = (
+        'article_id', 'source_url', 'source_url_ok', 'author_name',
+        'wikitext_paragraphs'
+    )
+    FIELD_NAMES = ('article_id', 'source_url', 'source_url_ok', 'author_name')
+
+    article_id: int
+    source_url: str
+    source_url_ok: Optional[bool]
+    author_name: Optional[str]
+    wikitext_paragraphs: Optional[List[str]]
+
+    def __init__(
+        self, article_id: int, source_url: str, source_url_ok: Optional[bool],
+        author_name: Optional[str]
+    ):
+        self.article_id = article_id
+        self.source_url = source_url
+        self.source_url_ok = source_url_ok
+        self.author_name = author_name
+        self.wikitext_paragraphs = None
+
+
+class ArticlePageRow:
+    """Article fields used to render wiki-page, without model overhead."""
+
+    __slots__ = (
+        'article_id', 'slug_name', 'title', 'date', 'source_url',
+        'author_name', 'wikitext_paragraphs', 'misc_data'
+    )
+    FIELD_NAMES = (
+        'article_id', 'slug_name', 'title', 'date', 'source_url',
+        'author_name', 'wikitext_paragraphs'
+    )
+    FIELD_NAMES_WITH_MISC_DATA = FIELD_NAMES + ('misc_data',)
+
+    article_id: int
+    slug_name: str
+    title: str
+    date: datetime.datetime
+    source_url: str
+    author_name: Optional[str]
+    wikitext_paragraphs: Any
+    misc_data: Any
+
+    def __init__(
+        self, article_id: int, slug_name: str, title: str,
+        date: datetime.datetime, source_url: str,
+        author_name: Optional[str], wikitext_paragraphs: Any,
+        misc_data: Any = None
+    ):
+        self.article_id = article_id
+        self.slug_name = slug_name
+        self.title = title
+        self.date = date
+        self.source_url = source_url
+        self.author_name = author_name
+        self.wikitext_paragraphs = wikitext_paragraphs
+        self.misc_data = misc_data
+
+
+# Article data which can be passed to source module methods
+FetchedArticle = Union[Article, ArticleFetchRow]
+RenderedArticle = Union[Article, ArticlePageRow]
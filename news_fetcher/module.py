@@ -1,37 +1,106 @@
 """Base class for source modules."""
 import abc
-from typing import Dict, Iterable, List, Optional, Set, Tuple
+import dataclasses
+import hashlib
+import json
+from typing import (TYPE_CHECKING, Any, AsyncIterator, Container, Dict,
+                    Iterable, List, Optional, Set, Tuple)
 
-import aiohttp
 import tortoise
 
 import models
+from parsers import ParserBackend
+from wikitext import DEFAULT_BACKEND
+from write_buffer import ArticleWriteBuffer, save_stored_pages
+
+if TYPE_CHECKING:
+    import aiohttp
+
+    from page_store import PageStore
+
+ARTICLE_CONTENT_FIELDS = [
+    'source_url_ok', 'author_name', 'wikitext_paragraphs'
+]
+
+
+@dataclasses.dataclass
+class ArticleContent:
+    """Article data extracted from web page."""
+
+    author_name: Optional[str]
+    wikitext_paragraphs: List[str]
+
+    def apply(self, article: models.FetchedArticle) -> None:
+        """Write extracted data to article model without saving it."""
+        if self.author_name is not None:
+            article.author_name = self.author_name
+        article.wikitext_paragraphs = self.wikitext_paragraphs
+
+
+async def save_article_content(article: models.FetchedArticle) -> None:
+    """Save URL status and content fields of article with one query."""
+    await models.Article.filter(article_id=article.article_id).update(**{
+        field_name: getattr(article, field_name)
+        for field_name in ARTICLE_CONTENT_FIELDS
+    })
 
 
 class SourceModule(abc.ABC):
     """Base class for source modules."""
 
     source_slug_name: str
+    parser_backend: ParserBackend = DEFAULT_BACKEND
+    # If `False`, `misc_data` field is not loaded to render wiki-pages
+    wiki_page_uses_misc_data: bool = True
+    # If `True`, `fetch_news_batches` yields batches while page is
+    # downloaded, and they are saved as soon as they are fetched
+    streams_news: bool = False
 
     @abc.abstractmethod
     async def fetch_news(
-        self, session: aiohttp.ClientSession, page: int, source: models.Source
+        self, session: 'aiohttp.ClientSession', page: int,
+        source: models.Source,
+        known_slug_names: Container[str] = frozenset()
     ) -> Tuple[Iterable[models.Article], Dict[str, Set[str]]]:
         """
         Fetch news articles without acutally inserting them into database.
 
         Return tuple. First item should be iterable of article models.
         Second item should be dictionary mapping from slug names to sets of tag
-        titles.
+        titles. Entries with slug names from `known_slug_names` should be
+        skipped before their models and tags are created.
         """
         raise NotImplementedError()
 
+    async def fetch_news_batches(
+        self, session: 'aiohttp.ClientSession', page: int,
+        source: models.Source,
+        known_slug_names: Container[str] = frozenset()
+    ) -> AsyncIterator[Tuple[Iterable[models.Article], Dict[str, Set[str]]]]:
+        """
+        Fetch news in batches, like `fetch_news`.
+
+        All articles of page are yielded in one batch by default. Modules
+        which parse pages incrementally can yield smaller batches, and set
+        `streams_news` to `True`.
+        """
+        yield await self.fetch_news(session, page, source, known_slug_names)
+
     async def insert_news(
-        self, session: aiohttp.ClientSession, page: int, source: models.Source
+        self, session: 'aiohttp.ClientSession', page: int,
+        source: models.Source,
+        known_slug_names: Container[str] = frozenset()
     ) -> None:
         articles, tag_titles_by_slug_name = await self.fetch_news(
-            session, page, source
+            session, page, source, known_slug_names
         )
+        await self.save_news(source, articles, tag_titles_by_slug_name)
+
+    async def save_news(
+        self, source: models.Source, articles: Iterable[models.Article],
+        tag_titles_by_slug_name: Dict[str, Set[str]]
+    ) -> None:
+        """Insert articles returned by `fetch_news` and their tags into DB."""
         tag_titles: Set[str]
         if len(tag_titles_by_slug_name) != 0:
             tag_titles = set.union(*tag_titles_by_slug_name.values())
@@ -67,36 +136,181 @@ class SourceModule(abc.ABC):
             )
 
     async def check_url(
-        self, article: models.Article, session: aiohttp.ClientSession,
-        force: bool = False
+        self, article: models.FetchedArticle,
+        session: 'aiohttp.ClientSession', force: bool = False,
+        save: bool = True, write_buffer: Optional[ArticleWriteBuffer] = None
     ) -> None:
         """
         Check if URL is valid, write `url_ok` field and save model.
 
         Result is `True` if URL is correct (HEAD request returns 200),
-        `False` otherwise.
+        `False` otherwise. If server asks to send requests less often (429 or
+        503), URL is left unchecked. Server errors and transient request
+        errors (e.g. dropped connection) are raised, so that request can be
+        retried. If `save` is `False`, model is not saved. If `write_buffer`
+        is specified, model is saved by adding it to buffer.
         """
+        import aiohttp
+
+        from client import (THROTTLED_STATUSES, HTTPStatusError,
+                            is_transient_error, is_transient_status)
         if not force and article.source_url_ok is not None:
             return
         url_ok: bool = False
         try:
             async with session.head(article.source_url) as response:
+                if response.status in THROTTLED_STATUSES:
+                    return
+                if is_transient_status(response.status):
+                    raise HTTPStatusError(response.status)
                 url_ok = response.status == 200
-        except aiohttp.client_exceptions.ClientError:
-            pass
+        except aiohttp.client_exceptions.ClientError as exc:
+            if is_transient_error(exc):
+                raise
         article.source_url_ok = url_ok
-        await article.save()
+        if not save:
+            return
+        if write_buffer is not None:
+            await write_buffer.add(article)
+        else:
+            await models.Article.filter(article_id=article.article_id).update(
+                source_url_ok=url_ok
+            )
+
+    async def download_article(
+        self, article: models.FetchedArticle,
+        session: 'aiohttp.ClientSession'
+    ) -> Optional[str]:
+        """
+        Download article web page, write `url_ok` field and return page text.
+
+        If URL was not checked yet, it is considered correct if GET request
+        returns 200, just like in `check_url`. If URL is known to be correct,
+        only 404 marks it as incorrect, other statuses raise
+        `HTTPStatusError`. Server errors and responses asking to send
+        requests less often (429) always raise `HTTPStatusError`, and
+        transient request errors (e.g. dropped connection) are raised,
+        because request can succeed later. Return `None` if page can not be
+        retrieved. Model is not saved.
+        """
+        import aiohttp
+
+        from client import (HTTPStatusError, is_transient_error,
+                            is_transient_status)
+        url_checked = article.source_url_ok is not None
+        try:
+            async with session.get(article.source_url) as response:
+                if response.status == 200:
+                    article.source_url_ok = True
+                    return await response.text()
+                if (
+                    (url_checked and response.status != 404)
+                    or is_transient_status(response.status)
+                ):
+                    raise HTTPStatusError(response.status)
+        except aiohttp.client_exceptions.ClientError as exc:
+            if url_checked or is_transient_error(exc):
+                raise
+        article.source_url_ok = False
+        return None
 
-    @abc.abstractmethod
     async def fetch_article(
-        self, article: models.Article, session: aiohttp.ClientSession
+        self, article: models.FetchedArticle,
+        session: 'aiohttp.ClientSession',
+        write_buffer: Optional[ArticleWriteBuffer] = None,
+        page_store: Optional['PageStore'] = None
     ) -> None:
-        """Fetch article text and save it in database."""
-        raise NotImplementedError()
+        """
+        Fetch article text and save it in database.
+
+        URL status and article content are saved with one update query, or
+        added to `write_buffer` if it is specified. If `page_store` is
+        specified, downloaded page is saved to it.
+        """
+        if article.source_url_ok is False:
+            return
+
+        html = await self.download_article(article, session)
+        page_hash: Optional[str] = None
+        if html is not None:
+            self.extract_article(article.source_url, html).apply(article)
+            if page_store is not None:
+                page_hash = page_store.save(html)
+        if write_buffer is not None:
+            await write_buffer.add(article, page_hash)
+        else:
+            await save_article_content(article)
+            if page_hash is not None:
+                await save_stored_pages({article.article_id: page_hash})
 
     @abc.abstractmethod
+    def extract_article(self, source_url: str, html: str) -> ArticleContent:
+        """
+        Extract article data from web page text.
+
+        This method should not use database or network, so it can be called
+        in separate thread.
+        """
+        raise NotImplementedError()
+
+    def compact_misc_data(self, misc_data: Any) -> Any:
+        """
+        Remove data which is not needed from `misc_data` field of article.
+
+        It is used for new articles and by `compact-db` command.
+        """
+        return misc_data
+
+    def get_wiki_page_config(self) -> Dict[str, object]:
+        """
+        Get module configuration which is used to render wiki-pages.
+
+        It is used to detect if wiki-page should be rendered again.
+        """
+        return {}
+
+    def get_wiki_page_hash(
+        self, article: models.RenderedArticle, bot_name: str,
+        tag_titles: Iterable[str]
+    ) -> str:
+        """Get hash of all data which is used to render wiki-page."""
+        data = {
+            'module': type(self).__name__,
+            'config': self.get_wiki_page_config(),
+            'bot_name': bot_name,
+            'title': article.title,
+            'date': article.date,
+            'source_url': article.source_url,
+            'author_name': article.author_name,
+            'wikitext_paragraphs': article.wikitext_paragraphs,
+            'misc_data': article.misc_data,
+            'tag_titles': sorted(tag_titles)
+        }
+        return hashlib.sha256(json.dumps(
+            data, ensure_ascii=False, sort_keys=True, default=str
+        ).encode('utf-8')).hexdigest()
+
     async def get_wiki_page_text(
         self, article: models.Article, bot_name: str
     ) -> Optional[str]:
-        """Get wiki-page text for article from wiki-text paragraphs."""
+        """
+        Get wiki-page text for article from wiki-text paragraphs.
+
+        Article tags are loaded from database, use `render_wiki_page_text`
+        to render many articles with preloaded tags.
+        """
+        tag_titles = [tag.title for tag in await article.tags.all()]
+        return self.render_wiki_page_text(article, bot_name, tag_titles)
+
+    @abc.abstractmethod
+    def render_wiki_page_text(
+        self, article: models.RenderedArticle, bot_name: str,
+        tag_titles: Iterable[str]
+    ) -> Optional[str]:
+        """
+        Get wiki-page text for article from wiki-text paragraphs and tags.
+
+        This method should not use database. Article may be loaded without
+        `misc_data` field if `wiki_page_uses_misc_data` is `False`.
+        """
         raise NotImplementedError()
@@ -1,41 +1,60 @@
 #!/usr/bin/env python3
-"""Script to fetch news using API or RSS and convert them to wiki-text."""
-import asyncio
+"""
+Script to fetch news using API or RSS and convert them to wiki-text.
+
+Source modules, stages and their dependencies are imported only when
+command needs them, so that commands like `--help` start quickly.
+"""
 import json
 import pathlib
-import re
 import sys
-from typing import Dict, Iterable, Optional, TextIO, Tuple
+from typing import (TYPE_CHECKING, Any, Awaitable, Callable, Dict, List,
+                    Optional, Set, TextIO, TypeVar)
 
-import aiohttp
 import click
-import tortoise
-from tortoise.expressions import Q
 
-import models
-from db import init_db
-from module import SourceModule
-from prostoprosport import ProstoprosportModule
-from rss import RSSModule
-from utils import check_dict_str_object
+from json_codec import COMPRESSION_METHODS, PARAGRAPHS_CODEC
+from parsers import (DEFAULT_PARSER_BACKEND_NAME, PARSER_BACKEND_CREATORS,
+                     get_parser_backend)
+from utils import check_dict_str_object, check_optional_str, check_str
+
+if TYPE_CHECKING:
+    from client import RetryPolicy, SessionFactory
+    from module import SourceModule
+    from page_store import PageStore
+
+T = TypeVar('T')
+
 
+def run_with_db(
+    function: Callable[..., Awaitable[T]], *args: Any,
+    check_version: bool = True, **kwargs: Any
+) -> T:
+    """Connect to DB, run coroutine function and close DB connections."""
+    import asyncio
 
-def wrap_run(function):  # type: ignore
-    async def wrapped(*args, **kwargs):  # type: ignore
-        await init_db()
+    import tortoise
+
+    from db import init_db
+
+    async def run() -> T:
         try:
-            result = await function(*args, **kwargs)
+            try:
+                await init_db(check_version=check_version)
+            except ValueError as exc:
+                raise click.ClickException(str(exc))
+            return await function(*args, **kwargs)
         finally:
             await tortoise.connection.connections.close_all(discard=True)
-        return result
 
-    return wrapped
+    return asyncio.run(run())
 
 
 def create_rss_module(
     data_file: Optional[TextIO], source_path: str,
     source_name: Optional[str]
-) -> SourceModule:
+) -> 'SourceModule':
+    from rss import RSSModule
     if (data_file is None) or (source_name is None):
         raise click.ClickException(
             '--data-file and --source-name are required when using '
@@ -52,7 +71,8 @@ def create_rss_module(
 def create_prostoprosport_module(
     data_file: Optional[TextIO], source_path: str,
     _source_name: Optional[str]
-) -> SourceModule:
+) -> 'SourceModule':
+    from prostoprosport import ProstoprosportModule
     try:
         return ProstoprosportModule(data_file, source_path)
     except ValueError as exc:
@@ -67,46 +87,205 @@ DATA_CREATORS = {
 }
 
 
-@click.group()
-@click.pass_context
-@click.option('--source-module', type=click.STRING, required=True)
-@click.option('--data-file', type=click.File(mode='rt'))
-@click.option('--source-path', type=click.STRING, required=True)
-@click.option('--source-name', type=click.STRING)
-def cli(
-    ctx: click.Context, source_module: str,
-    data_file: Optional[TextIO], source_path: str,
-    source_name: str
-) -> None:
-    """Command line."""
-    ctx.ensure_object(dict)
-
+def create_module(
+    source_module: str, data_file: Optional[TextIO], source_path: str,
+    source_name: Optional[str], parser_backend: str
+) -> 'SourceModule':
+    """Create source module, raise `click.ClickException` on error."""
     if source_module not in DATA_CREATORS:
         raise click.ClickException(
             f'Invalid source module name {source_module}'
         )
 
-    ctx.obj['MODULE'] = DATA_CREATORS[source_module](
+    module = DATA_CREATORS[source_module](
         data_file, source_path, source_name
     )
+    try:
+        module.parser_backend = get_parser_backend(parser_backend)
+    except ValueError as exc:
+        raise click.ClickException(
+            f'Error when initalizing parser backend: {exc}'
+        )
+    return module
+
+
+def create_context_session_factory(ctx: click.Context) -> 'SessionFactory':
+    """
+    Create HTTP session factory from command line options.
+
+    Options override values from session config file.
+    """
+    from client import HostRateLimiter, SessionConfig, SessionFactory
+    initial_rate, max_rate = ctx.obj['RATE_LIMITS']
+    try:
+        config = SessionConfig.from_json_dict(ctx.obj['SESSION_CONFIG'])
+    except ValueError as exc:
+        raise click.ClickException(f'Invalid session config: {exc}')
+    return SessionFactory(config, HostRateLimiter(
+        initial_rate=min(initial_rate, max_rate), max_rate=max_rate
+    ))
 
 
-async def fetch_news_async(
-    module: SourceModule, first_page: int, last_page: int
+def create_context_retry_policy(ctx: click.Context) -> 'RetryPolicy':
+    """Create retry policy from command line options."""
+    from client import RetryPolicy
+    retries, retry_delay = ctx.obj['RETRIES']
+    return RetryPolicy(attempts=retries + 1, base_delay=retry_delay)
+
+
+def create_context_page_store(ctx: click.Context) -> Optional['PageStore']:
+    """Create page store from command line options, if it is specified."""
+    from page_store import PageStore
+    directory, max_size, max_age = ctx.obj['PAGE_STORE']
+    if directory is None:
+        return None
+    return PageStore(
+        pathlib.Path(directory),
+        max_size=None if max_size is None else max_size * 1024 * 1024,
+        max_age=None if max_age is None else max_age * 24 * 60 * 60
+    )
+
+
+def get_context_module(ctx: click.Context) -> 'SourceModule':
+    """Get source module created from command line options."""
+    module: Optional['SourceModule'] = ctx.obj['MODULE']
+    if module is None:
+        raise click.ClickException(
+            '--source-module and --source-path are required for this command'
+        )
+    return module
+
+
+@click.group()
+@click.pass_context
+@click.option('--source-module', type=click.STRING)
+@click.option('--data-file', type=click.File(mode='rt'))
+@click.option('--source-path', type=click.STRING)
+@click.option('--source-name', type=click.STRING)
+@click.option(
+    '--parser-backend', type=click.Choice(list(PARSER_BACKEND_CREATORS)),
+    default=DEFAULT_PARSER_BACKEND_NAME,
+    help='HTML parser to extract article text from web pages'
+)
+@click.option(
+    '--requests-per-second', type=click.FloatRange(min=0, min_open=True),
+    default=4.0,
+    help=(
+        'Initial number of requests per second to one host, it is adapted '
+        'to server responses'
+    )
+)
+@click.option(
+    '--max-requests-per-second',
+    type=click.FloatRange(min=0, min_open=True), default=50.0,
+    help='Maximum number of requests per second to one host'
+)
+@click.option(
+    '--retries', type=click.IntRange(min=0), default=3,
+    help='Number of times to retry requests failed with transient errors'
+)
+@click.option(
+    '--retry-delay', type=click.FloatRange(min=0), default=1.0,
+    help=(
+        'Maximum delay in seconds before first retry, it is doubled for '
+        'every next retry'
+    )
+)
+@click.option(
+    '--session-config', type=click.File(mode='rt'),
+    help='JSON file with HTTP session options'
+)
+@click.option(
+    '--connection-limit', type=click.IntRange(min=0),
+    help='Maximum number of connections, 0 means no limit'
+)
+@click.option(
+    '--dns-cache-ttl', type=click.IntRange(min=0),
+    help='Time in seconds to cache resolved host addresses'
+)
+@click.option(
+    '--keepalive-timeout', type=click.FloatRange(min=0),
+    help='Time in seconds to keep idle connections open to reuse them'
+)
+@click.option(
+    '--timeout', type=click.FloatRange(min=0, min_open=True),
+    help='Total timeout of one request in seconds'
+)
+@click.option(
+    '--accept-encoding', type=click.STRING,
+    help='Value of Accept-Encoding header'
+)
+@click.option(
+    '--paragraph-compression', type=click.Choice(COMPRESSION_METHODS),
+    default='none',
+    help='Compression of wiki-text paragraphs of articles saved in DB'
+)
+@click.option(
+    '--page-store', type=click.Path(dir_okay=True, file_okay=False),
+    help='Directory to store downloaded web pages'
+)
+@click.option(
+    '--page-store-max-size', type=click.IntRange(min=0),
+    help='Maximum size of stored web pages in megabytes'
+)
+@click.option(
+    '--page-store-max-age', type=click.FloatRange(min=0),
+    help='Maximum time in days to keep stored web pages'
+)
+def cli(
+    ctx: click.Context, source_module: Optional[str],
+    data_file: Optional[TextIO], source_path: Optional[str],
+    source_name: Optional[str], parser_backend: str,
+    requests_per_second: float, max_requests_per_second: float,
+    retries: int, retry_delay: float, session_config: Optional[TextIO],
+    connection_limit: Optional[int], dns_cache_ttl: Optional[int],
+    keepalive_timeout: Optional[float], timeout: Optional[float],
+    accept_encoding: Optional[str], paragraph_compression: str,
+    page_store: Optional[str],
+    page_store_max_size: Optional[int], page_store_max_age: Optional[float]
 ) -> None:
-    source, _ = await models.Source.get_or_create(
-        slug_name=module.source_slug_name
+    """
+    Command line.
+
+    Source module options are required for all commands except `init-db`
+    and `run-all`.
+    """
+    ctx.ensure_object(dict)
+    ctx.obj['RATE_LIMITS'] = (requests_per_second, max_requests_per_second)
+    ctx.obj['RETRIES'] = (retries, retry_delay)
+    session_config_data: Dict[str, object] = {}
+    if session_config is not None:
+        try:
+            session_config_data = check_dict_str_object(
+                json.load(session_config)
+            )
+        except (ValueError, TypeError) as exc:
+            raise click.ClickException(f'Invalid session config: {exc!r}')
+    options: Dict[str, object] = {
+        'limit': connection_limit, 'dns_cache_ttl': dns_cache_ttl,
+        'keepalive_timeout': keepalive_timeout, 'total_timeout': timeout,
+        'accept_encoding': accept_encoding
+    }
+    session_config_data.update(
+        (key, value) for key, value in options.items() if value is not None
+    )
+    ctx.obj['SESSION_CONFIG'] = session_config_data
+    try:
+        PARAGRAPHS_CODEC.set_compression(paragraph_compression)
+    except ValueError as exc:
+        raise click.ClickException(
+            f'Error when initializing paragraph compression: {exc}'
+        )
+    ctx.obj['PAGE_STORE'] = (
+        page_store, page_store_max_size, page_store_max_age
     )
 
-    async with aiohttp.ClientSession() as session:  # TODO: pool
-        with click.progressbar(
-            range(first_page, last_page + 1),
-            length=(last_page + 1 - first_page)
-        ) as bar1:
-            for page in bar1:
-                await module.insert_news(
-                    session, page, source
-                )
+    if (source_module is None) or (source_path is None):
+        ctx.obj['MODULE'] = None
+        return
+    ctx.obj['MODULE'] = create_module(
+        source_module, data_file, source_path, source_name, parser_backend
+    )
 
 
 @click.command()
@@ -119,8 +298,24 @@ async def fetch_news_async(
     '--last-page', type=click.IntRange(min=1), default=1,
     help='Number of last page to load, should be not less than 1'
 )
+@click.option(
+    '--concurrency', type=click.IntRange(min=1), default=1,
+    help='Number of pages to fetch at the same time'
+)
+@click.option(
+    '--early-stop', is_flag=True,
+    help=(
+        'Fetch pages from first page and stop at first page without new '
+        'articles'
+    )
+)
+@click.option(
+    '--resume', is_flag=True,
+    help='Skip pages which were saved by previous interrupted run'
+)
 def fetch_news(
-    ctx: click.Context, first_page: int, last_page: int
+    ctx: click.Context, first_page: int, last_page: int, concurrency: int,
+    early_stop: bool, resume: bool
 ) -> None:
     """
     Fetch news from Prostoprosport.ru using API.
@@ -128,72 +323,131 @@ def fetch_news(
     Page numbers are from most recent (1) to least recent.
     Results are retrieved from least recent to first recent.
     """
-    module = ctx.obj['MODULE']
+    from stages import fetch_news_async
+    module = get_context_module(ctx)
 
-    asyncio.run(
-        wrap_run(fetch_news_async)(
-            module, first_page, last_page
-        )
+    run_with_db(
+        fetch_news_async, module, first_page, last_page, concurrency,
+        early_stop, session_factory=create_context_session_factory(ctx),
+        retry_policy=create_context_retry_policy(ctx), resume=resume
     )
 
 
-async def fetch_news_pages_async(module: ProstoprosportModule) -> None:
-    source, _ = await models.Source.get_or_create(
-        slug_name=module.source_slug_name
-    )
-
-    async with aiohttp.ClientSession() as session:
-        articles = await source.articles.filter(
-            Q(wikitext_paragraphs=None) & (
-                Q(source_url_ok=1) | Q(source_url_ok=None)
-            )
-        )
-        with click.progressbar(
-            articles
-        ) as bar:
-            for article in bar:
-                await module.check_url(article, session)
-                await module.fetch_article(article, session)
-
-
 @click.command()
 @click.pass_context
+@click.option(
+    '--verify-only', is_flag=True,
+    help='Only check URLs of all articles using HEAD requests'
+)
+@click.option(
+    '--pipeline', is_flag=True,
+    help='Download, parse and save articles concurrently'
+)
+@click.option(
+    '--download-concurrency', type=click.IntRange(min=1), default=8,
+    help=(
+        'Number of articles to download (or check) at the same time in '
+        'pipeline (or verify-only) mode'
+    )
+)
+@click.option(
+    '--parse-concurrency', type=click.IntRange(min=1), default=2,
+    help='Number of threads to parse articles in pipeline mode'
+)
+@click.option(
+    '--parse-processes', type=click.IntRange(min=0), default=0,
+    help=(
+        'Number of processes to parse articles in pipeline mode, '
+        '0 means that threads are used'
+    )
+)
+@click.option(
+    '--write-batch-size', type=click.IntRange(min=1), default=50,
+    help='Number of articles to save in one transaction'
+)
+@click.option(
+    '--write-delay', type=click.FloatRange(min=0, min_open=True), default=1.0,
+    help='Maximum time in seconds to keep articles before saving them'
+)
+@click.option(
+    '--limit-per-host', type=click.IntRange(min=0),
+    help=(
+        'Maximum number of connections to one host, 0 means no limit, '
+        'value from session config is used by default'
+    )
+)
+@click.option(
+    '--chunk-size', type=click.IntRange(min=1), default=500,
+    help='Number of articles to load from DB at once'
+)
 def fetch_news_pages(
-    ctx: click.Context
+    ctx: click.Context, verify_only: bool, pipeline: bool,
+    download_concurrency: int, parse_concurrency: int, parse_processes: int,
+    write_batch_size: int, write_delay: float,
+    limit_per_host: Optional[int], chunk_size: int
 ) -> None:
     """Fetch articles for news."""
-    module = ctx.obj['MODULE']
+    from stages import fetch_news_pages_async, verify_news_urls_async
+    module = get_context_module(ctx)
+
+    if verify_only:
+        run_with_db(
+            verify_news_urls_async, module, download_concurrency,
+            limit_per_host, chunk_size, write_batch_size, write_delay,
+            session_factory=create_context_session_factory(ctx),
+            retry_policy=create_context_retry_policy(ctx)
+        )
+        return
+
+    run_with_db(
+        fetch_news_pages_async, module, pipeline, download_concurrency,
+        parse_concurrency, write_batch_size, limit_per_host, parse_processes,
+        chunk_size, write_delay,
+        session_factory=create_context_session_factory(ctx),
+        retry_policy=create_context_retry_policy(ctx),
+        page_store=create_context_page_store(ctx)
+    )
 
-    asyncio.run(wrap_run(fetch_news_pages_async)(module))
 
+@click.command()
+@click.pass_context
+@click.option(
+    '--processes', type=click.IntRange(min=1),
+    help='Number of processes to parse pages, number of CPUs by default'
+)
+@click.option(
+    '--write-batch-size', type=click.IntRange(min=1), default=50,
+    help='Number of articles to save in one transaction'
+)
+@click.option(
+    '--chunk-size', type=click.IntRange(min=1), default=500,
+    help='Number of articles to load from DB at once'
+)
+def reextract(
+    ctx: click.Context, processes: Optional[int], write_batch_size: int,
+    chunk_size: int
+) -> None:
+    """
+    Extract articles again from stored web pages.
 
-async def generate_wiki_pages_async(
-    module: ProstoprosportModule, bot_name: str,
-    output_directory_path: pathlib.Path
-) -> Dict[str, Tuple[pathlib.Path, str, str]]:
-    source, _ = await models.Source.get_or_create(
-        slug_name=module.source_slug_name
+    Pages are loaded from page store, nothing is downloaded.
+    """
+    from stages import reextract_async
+    module = get_context_module(ctx)
+    page_store = create_context_page_store(ctx)
+    if page_store is None:
+        raise click.ClickException('--page-store is required for this command')
+
+    missing_count = run_with_db(
+        reextract_async, module, page_store, processes, chunk_size,
+        write_batch_size
     )
-
-    pages: Dict[str, Tuple[pathlib.Path, str, str]] = {}
-
-    with click.progressbar(
-        await source.articles.filter(
-            ~Q(wikitext_paragraphs=None) & Q(uploaded=False)
+    if missing_count != 0:
+        click.echo(
+            f'{missing_count} pages are missing in page store, their articles '
+            'were not changed',
+            err=True
         )
-    ) as bar:
-        for article in bar:
-            article_name = re.sub(r'[^0-9a-zA-Z\-_]+', '', article.slug_name)
-            page_file_path = output_directory_path.joinpath(
-                f'{article_name}.txt'
-            )
-            wiki_page_text = await module.get_wiki_page_text(article, bot_name)
-            if wiki_page_text is not None:
-                pages[article.title] = (
-                    page_file_path, wiki_page_text, article.slug_name
-                )
-
-    return pages
 
 
 @click.command()
@@ -210,42 +464,25 @@ async def generate_wiki_pages_async(
 @click.option(
     '--bot-name', default='NewsBot', type=click.STRING
 )
+@click.option(
+    '--chunk-size', type=click.IntRange(min=1), default=500,
+    help='Number of articles to load from DB at once'
+)
+@click.option(
+    '--force', is_flag=True,
+    help='Render and write all pages, even if they are not changed'
+)
 def generate_wiki_pages(
     ctx: click.Context, output_file: TextIO, output_directory: str,
-    bot_name: str
+    bot_name: str, chunk_size: int, force: bool
 ) -> None:
     """Generate wiki-pages for news articles."""
-    module = ctx.obj['MODULE']
-
-    pages = asyncio.run(wrap_run(generate_wiki_pages_async)(
-        module, bot_name, pathlib.Path(output_directory)
-    ))
+    from stages import generate_wiki_pages_async
+    module = get_context_module(ctx)
 
-    pages_data: Dict[str, Dict[str, str]] = {}
-    with click.progressbar(pages.items(), length=len(pages)) as bar:
-        for page_title, page_data in bar:
-            page_file_path, wiki_page_text, page_slug_name = page_data
-            with open(page_file_path, mode='wt') as page_file:
-                page_file.write(wiki_page_text)
-            pages_data[page_slug_name] = {
-                'path': str(page_file_path),
-                'title': page_title
-            }
-
-    json.dump(pages_data, output_file, ensure_ascii=False, indent=4)
-
-
-async def mark_uploaded_pages_async(
-    module: ProstoprosportModule, slug_names: Iterable[str]
-) -> None:
-    source, _ = await models.Source.get_or_create(
-        slug_name=module.source_slug_name
-    )
-
-    await source.articles.filter(
-        slug_name__in=slug_names
-    ).update(
-        uploaded=True
+    run_with_db(
+        generate_wiki_pages_async, module, bot_name,
+        pathlib.Path(output_directory), output_file, chunk_size, force
     )
 
 
@@ -259,20 +496,177 @@ def mark_uploaded_pages(
     ctx: click.Context, input_file: TextIO
 ) -> None:
     """Mark news articles as uploaded."""
-    module = ctx.obj['MODULE']
+    from stages import mark_uploaded_pages_async
+    module = get_context_module(ctx)
 
     pages_data = check_dict_str_object(json.load(input_file))
 
-    asyncio.run(wrap_run(mark_uploaded_pages_async)(
-        module,
-        pages_data.keys()
-    ))
+    run_with_db(mark_uploaded_pages_async, module, pages_data.keys())
+
+
+def load_manifest(manifest_file: TextIO) -> List['SourceModule']:
+    """
+    Create source modules from manifest file.
+
+    Manifest file should contain JSON list of dictionaries with
+    `source_module`, `source_path`, and optional `data_file`, `source_name`
+    and `parser_backend` keys, which have the same meaning as command line
+    options. Every source slug name should be used once.
+    """
+    modules: List['SourceModule'] = []
+    source_slug_names: Set[str] = set()
+    try:
+        manifest_data = json.load(manifest_file)
+        if not isinstance(manifest_data, list):
+            raise TypeError(manifest_data)
+        for element in manifest_data:
+            source_data = check_dict_str_object(element)
+            data_file_path = check_optional_str(source_data.get('data_file'))
+            data_file: Optional[TextIO] = None
+            if data_file_path is not None:
+                data_file = open(data_file_path, mode='rt')
+            try:
+                modules.append(create_module(
+                    check_str(source_data.get('source_module')), data_file,
+                    check_str(source_data.get('source_path')),
+                    check_optional_str(source_data.get('source_name')),
+                    check_optional_str(source_data.get('parser_backend'))
+                    or DEFAULT_PARSER_BACKEND_NAME
+                ))
+            finally:
+                if data_file is not None:
+                    data_file.close()
+            source_slug_name = modules[-1].source_slug_name
+            if source_slug_name in source_slug_names:
+                raise click.ClickException(
+                    f'Invalid manifest file: duplicate source '
+                    f'{source_slug_name}'
+                )
+            source_slug_names.add(source_slug_name)
+    except (ValueError, TypeError, OSError) as exc:
+        raise click.ClickException(f'Invalid manifest file: {exc!r}')
+    return modules
+
+
+@click.command()
+@click.pass_context
+@click.option(
+    '--manifest-file', type=click.File(mode='rt'), required=True,
+    help='JSON file with list of sources'
+)
+@click.option(
+    '--output-directory', default='data1/pages',
+    type=click.Path(exists=True, dir_okay=True, file_okay=False),
+    help=(
+        'Output directory for directories with wiki-pages and JSON files '
+        'with lists of pages for every source'
+    )
+)
+@click.option(
+    '--bot-name', default='NewsBot', type=click.STRING
+)
+@click.option(
+    '--last-page', type=click.IntRange(min=1), default=1,
+    help='Number of last page to load, should be not less than 1'
+)
+@click.option(
+    '--early-stop', is_flag=True,
+    help='Stop fetching pages at first page without new articles'
+)
+@click.option(
+    '--source-concurrency', type=click.IntRange(min=1), default=4,
+    help='Number of sources to process at the same time'
+)
+@click.option(
+    '--download-concurrency', type=click.IntRange(min=1), default=8,
+    help='Number of articles of one source to download at the same time'
+)
+def run_all(
+    ctx: click.Context, manifest_file: TextIO, output_directory: str,
+    bot_name: str, last_page: int, early_stop: bool, source_concurrency: int,
+    download_concurrency: int
+) -> None:
+    """
+    Fetch news and articles and generate wiki-pages for many sources.
+
+    All sources are processed in one process with one DB connection.
+    """
+    from stages import run_all_async
+    modules = load_manifest(manifest_file)
+
+    failed_count = run_with_db(
+        run_all_async, modules, pathlib.Path(output_directory), bot_name,
+        last_page, early_stop, source_concurrency, download_concurrency,
+        session_factory=create_context_session_factory(ctx),
+        retry_policy=create_context_retry_policy(ctx),
+        page_store=create_context_page_store(ctx)
+    )
+    if failed_count != 0:
+        raise click.ClickException(f'{failed_count} sources failed')
+
+
+@click.command()
+@click.pass_context
+@click.option(
+    '--chunk-size', type=click.IntRange(min=1), default=500,
+    help='Number of articles to rewrite in one transaction'
+)
+@click.option(
+    '--vacuum', is_flag=True,
+    help='Vacuum DB to return free space to file system'
+)
+def compact_db(ctx: click.Context, chunk_size: int, vacuum: bool) -> None:
+    """
+    Rewrite articles data in compact form.
+
+    Unused data is removed from `misc_data` field, wiki-text paragraphs are
+    compressed with method from `--paragraph-compression` option.
+    """
+    from stages import compact_db_async
+    module = get_context_module(ctx)
+
+    old_size, new_size = run_with_db(
+        compact_db_async, module, chunk_size, vacuum
+    )
+    saved_percent = (
+        0.0 if old_size == 0 else (old_size - new_size) * 100 / old_size
+    )
+    click.echo(
+        f'Article data size: {old_size} bytes before, {new_size} bytes '
+        f'after, {old_size - new_size} bytes ({saved_percent:.1f}%) saved',
+        err=True
+    )
+
+
+@click.command()
+def init_db_command() -> None:
+    """
+    Create DB tables and indexes or add missing ones.
+
+    It should be run once before other commands, and after update if DB
+    schema version is changed. Other commands only check schema version.
+    """
+    from db import SCHEMA_VERSION, migrate_db
+    old_version = run_with_db(migrate_db, check_version=False)
+    if old_version is None:
+        click.echo(f'DB is initialized with schema version {SCHEMA_VERSION}')
+    elif old_version == SCHEMA_VERSION:
+        click.echo(f'DB schema version {SCHEMA_VERSION} is current')
+    else:
+        click.echo(
+            f'DB schema version is changed from {old_version} to '
+            f'{SCHEMA_VERSION}'
+        )
 
 
 cli.add_command(fetch_news)
 cli.add_command(fetch_news_pages)
+cli.add_command(reextract)
 cli.add_command(generate_wiki_pages)
 cli.add_command(mark_uploaded_pages)
+cli.add_command(run_all)
+cli.add_command(compact_db)
+cli.add_command(init_db_command, 'init-db')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,118 @@
+"""Compressed on-disk store of raw web pages."""
+import gzip
+import hashlib
+import os
+import pathlib
+import tempfile
+import time
+from typing import List, Optional, Set, Tuple
+
+# Suffix of files with stored pages
+PAGE_FILE_SUFFIX = '.html.gz'
+
+
+class PageStore:
+    """
+    Store of downloaded web pages compressed with gzip.
+
+    Pages are stored in `directory` in files named after SHA-256 hash of page
+    content, so page with the same content is stored once. Article URL is
+    linked to content hash in DB (see `StoredPage` model).
+
+    `evict` removes pages which were not stored for `max_age` seconds, and
+    then least recently stored pages until total size of files is not
+    greater than `max_size` bytes. `None` means no limit.
+    """
+
+    directory: pathlib.Path
+    max_size: Optional[int]
+    max_age: Optional[float]
+    compress_level: int
+
+    def __init__(
+        self, directory: pathlib.Path, max_size: Optional[int] = None,
+        max_age: Optional[float] = None, compress_level: int = 6
+    ):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_age = max_age
+        self.compress_level = compress_level
+
+    def get_path(self, content_hash: str) -> pathlib.Path:
+        return self.directory.joinpath(
+            content_hash[:2], content_hash + PAGE_FILE_SUFFIX
+        )
+
+    def save(self, html: str) -> str:
+        """
+        Save page text if it is not stored yet, return its content hash.
+
+        Modification time of existing file is updated, so that it is not
+        evicted as old. File is written atomically, so that concurrent
+        processes do not read partially written file.
+        """
+        data = html.encode('utf-8')
+        content_hash = hashlib.sha256(data).hexdigest()
+        path = self.get_path(content_hash)
+        try:
+            os.utime(path)
+            return content_hash
+        except FileNotFoundError:
+            pass
+        path.parent.mkdir(parents=True, exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(
+            dir=path.parent, suffix='.tmp'
+        )
+        try:
+            with os.fdopen(file_descriptor, mode='wb') as file:
+                file.write(gzip.compress(data, self.compress_level))
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        return content_hash
+
+    def load(self, content_hash: str) -> Optional[str]:
+        """Load page text by content hash, return `None` if it is missing."""
+        try:
+            with open(self.get_path(content_hash), mode='rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        return gzip.decompress(data).decode('utf-8')
+
+    def get_files(self) -> List[Tuple[float, int, pathlib.Path]]:
+        """Get modification time, size and path of every stored page."""
+        files: List[Tuple[float, int, pathlib.Path]] = []
+        for path in self.directory.glob('*/*' + PAGE_FILE_SUFFIX):
+            try:
+                stat_result = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat_result.st_mtime, stat_result.st_size, path))
+        return files
+
+    def evict(self) -> Set[str]:
+        """Remove old pages according to limits, return their hashes."""
+        if (self.max_size is None) and (self.max_age is None):
+            return set()
+        files = sorted(self.get_files())
+        total_size = sum(size for _, size, _ in files)
+        min_mtime = (
+            None if self.max_age is None else time.time() - self.max_age
+        )
+        removed_hashes: Set[str] = set()
+        for mtime, size, path in files:
+            too_old = (min_mtime is not None) and (mtime < min_mtime)
+            too_large = (
+                (self.max_size is not None) and (total_size > self.max_size)
+            )
+            if not (too_old or too_large):
+                break
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            removed_hashes.add(path.name[:-len(PAGE_FILE_SUFFIX)])
+        return removed_hashes
@@ -0,0 +1,246 @@
+"""HTML parser backends."""
+import abc
+import functools
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Union
+
+# Parser libraries are imported by backends when they are used, so that
+# command line does not load them if it does not parse web pages
+if TYPE_CHECKING:
+    import bs4
+
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+
+
+def collapse_whitespace_string(text: str) -> str:
+    """
+    Collapse string containing only whitespace like BeautifulSoup does.
+
+    BeautifulSoup replaces such strings with single newline (if string has
+    newlines) or single space.
+    """
+    if text.strip(ASCII_SPACES) != '':
+        return text
+    if '\n' in text:
+        return '\n'
+    return ' '
+
+
+class ParserBackend(abc.ABC):
+    """
+    Base class for HTML parser backends.
+
+    Backend parses web page and provides access to nodes of its own type:
+    element nodes have tag names, text nodes have `None` as tag name.
+    """
+
+    name: str
+
+    @abc.abstractmethod
+    def parse(self, html: str) -> Any:
+        """Parse web page and return document node."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def select(self, node: Any, css_selector: str) -> List[Any]:
+        """Return list of element nodes matching CSS selector."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_text(self, node: Any) -> str:
+        """Return text content of node with its descendants."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_tag_name(self, node: Any) -> Any:
+        """Return tag name of element node, or `None` for text node."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_string(self, node: Any) -> str:
+        """Return text of text node."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_attribute(self, node: Any, attribute_name: str) -> str:
+        """Return attribute of element node, raise `KeyError` if missing."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def get_children(self, node: Any) -> Iterable[Any]:
+        """Iterate over child nodes of element node, including text nodes."""
+        raise NotImplementedError()
+
+
+class BeautifulSoupBackend(ParserBackend):
+    """Backend using BeautifulSoup with specified tree builder."""
+
+    features: str
+
+    def __init__(self, name: str, features: str):
+        self.name = name
+        self.features = features
+
+    def parse(self, html: str) -> 'bs4.BeautifulSoup':
+        import bs4
+        return bs4.BeautifulSoup(markup=html, features=self.features)
+
+    def select(
+        self, node: 'bs4.element.Tag', css_selector: str
+    ) -> List['bs4.element.Tag']:
+        return list(node.select(css_selector))
+
+    def get_text(self, node: 'bs4.element.PageElement') -> str:
+        return str(node.text)
+
+    def get_tag_name(
+        self, node: Union['bs4.element.Tag', 'bs4.element.NavigableString']
+    ) -> Any:
+        # Text nodes (`NavigableString` and its subclasses) have `None` name
+        return node.name
+
+    def get_string(self, node: 'bs4.element.NavigableString') -> str:
+        return str(node.string)
+
+    def get_attribute(
+        self, node: 'bs4.element.Tag', attribute_name: str
+    ) -> str:
+        return node.attrs[attribute_name]  # type: ignore
+
+    def get_children(
+        self, node: 'bs4.element.Tag'
+    ) -> Iterable['bs4.element.PageElement']:
+        return node.children
+
+
+@functools.lru_cache(maxsize=None)
+def get_lxml_selector(css_selector: str) -> Callable[[Any], List[Any]]:
+    import lxml.cssselect
+    return lxml.cssselect.CSSSelector(css_selector)  # type: ignore
+
+
+class LXMLBackend(ParserBackend):
+    """
+    Backend using lxml with cssselect.
+
+    Text nodes are represented as `str` objects.
+    """
+
+    name = 'lxml'
+
+    def __init__(self) -> None:
+        try:
+            import lxml.cssselect  # noqa: F401
+            import lxml.html  # noqa: F401
+        except ImportError:
+            raise ValueError('lxml and cssselect are not installed')
+
+    def parse(self, html: str) -> Any:
+        import lxml.html
+
+        # Pass bytes, because lxml does not accept `str` with XML encoding
+        # declaration
+        return lxml.html.document_fromstring(
+            html.encode('utf-8'),
+            parser=lxml.html.HTMLParser(encoding='utf-8')
+        )
+
+    def select(self, node: Any, css_selector: str) -> List[Any]:
+        return get_lxml_selector(css_selector)(node)
+
+    def get_text(self, node: Any) -> str:
+        return str(node.text_content())
+
+    def get_tag_name(self, node: Any) -> Any:
+        if isinstance(node, str):
+            return None
+        return node.tag
+
+    def get_string(self, node: Any) -> str:
+        return collapse_whitespace_string(str(node))
+
+    def get_attribute(self, node: Any, attribute_name: str) -> str:
+        return str(node.attrib[attribute_name])
+
+    def get_children(self, node: Any) -> Iterable[Any]:
+        if node.text:
+            yield node.text
+        for child in node:
+            if isinstance(child.tag, str):
+                yield child
+            elif child.text:
+                # Comments and processing instructions are converted to text
+                # like in BeautifulSoup
+                yield child.text
+            if child.tail:
+                yield child.tail
+
+
+class SelectolaxBackend(ParserBackend):
+    """Backend using selectolax with lexbor engine."""
+
+    name = 'selectolax'
+
+    def __init__(self) -> None:
+        try:
+            import selectolax.lexbor  # noqa: F401
+        except ImportError:
+            raise ValueError('selectolax is not installed')
+
+    def parse(self, html: str) -> Any:
+        import selectolax.lexbor
+        return selectolax.lexbor.LexborHTMLParser(html)
+
+    def select(self, node: Any, css_selector: str) -> List[Any]:
+        return list(node.css(css_selector))
+
+    def get_text(self, node: Any) -> str:
+        return str(node.text())
+
+    def get_tag_name(self, node: Any) -> Any:
+        if node.tag == '-text':
+            return None
+        if node.tag == '-comment':
+            return None
+        return node.tag
+
+    def get_string(self, node: Any) -> str:
+        if node.tag == '-comment':
+            # `comment_content` strips whitespace, so it is not used
+            return str(node.html)[len('<!--'):-len('-->')]
+        return collapse_whitespace_string(str(node.text_content or ''))
+
+    def get_attribute(self, node: Any, attribute_name: str) -> str:
+        value = node.attributes[attribute_name]
+        if value is None:
+            return ''
+        return str(value)
+
+    def get_children(self, node: Any) -> Iterable[Any]:
+        children: Iterable[Any] = node.iter(include_text=True)
+        return children
+
+
+def create_bs4_lxml_backend() -> BeautifulSoupBackend:
+    """Create BeautifulSoup backend with lxml tree builder."""
+    try:
+        import lxml.html  # noqa: F401
+    except ImportError:
+        raise ValueError('lxml is not installed')
+    return BeautifulSoupBackend('bs4-lxml', 'lxml')
+
+
+DEFAULT_PARSER_BACKEND_NAME = 'html.parser'
+
+PARSER_BACKEND_CREATORS: Dict[str, Callable[[], ParserBackend]] = {
+    'html.parser': lambda: BeautifulSoupBackend('html.parser', 'html.parser'),
+    'bs4-lxml': create_bs4_lxml_backend,
+    'lxml': LXMLBackend,
+    'selectolax': SelectolaxBackend
+}
+
+
+def get_parser_backend(name: str) -> ParserBackend:
+    """Create parser backend by name, raise `ValueError` if not available."""
+    if name not in PARSER_BACKEND_CREATORS:
+        raise ValueError(f'Invalid parser backend name {name}')
+    return PARSER_BACKEND_CREATORS[name]()
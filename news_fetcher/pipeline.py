@@ -0,0 +1,242 @@
+"""Pipeline to download, parse and save article pages concurrently."""
+import asyncio
+import concurrent.futures
+import functools
+from typing import TYPE_CHECKING, AsyncIterable, Callable, Optional, Tuple
+
+import models
+from client import NO_RETRY_POLICY, REQUEST_ERRORS, RetryPolicy
+from module import ARTICLE_CONTENT_FIELDS, ArticleContent, SourceModule
+from write_buffer import ArticleWriteBuffer
+
+if TYPE_CHECKING:
+    import aiohttp
+
+    from page_store import PageStore
+
+    ArticleQueue = asyncio.Queue[Optional[models.FetchedArticle]]
+    ParseQueue = asyncio.Queue[Optional[Tuple[models.FetchedArticle, str]]]
+    WriteQueue = asyncio.Queue[
+        Optional[Tuple[models.FetchedArticle, Optional[str]]]
+    ]
+
+worker_module: Optional[SourceModule] = None
+
+
+def init_parse_worker(module: SourceModule) -> None:
+    """Initialize parse worker process with source module."""
+    global worker_module
+    worker_module = module
+
+
+def extract_article_in_worker(source_url: str, html: str) -> ArticleContent:
+    """Extract article data in parse worker process."""
+    if worker_module is None:
+        raise ValueError('Parse worker is not initialized')
+    return worker_module.extract_article(source_url, html)
+
+
+def reextract_article_in_worker(
+    page_store: 'PageStore', content_hash: str, source_url: str
+) -> Optional[ArticleContent]:
+    """
+    Load stored page and extract article data in parse worker process.
+
+    Return `None` if page is missing in page store.
+    """
+    html = page_store.load(content_hash)
+    if html is None:
+        return None
+    return extract_article_in_worker(source_url, html)
+
+
+class ArticlePipeline:
+    """
+    Pipeline with download, parse and DB write stages.
+
+    Download stage downloads pages and checks URLs using `download_workers`
+    coroutines. Parse stage extracts article data in thread pool with
+    `parse_workers` threads, or in process pool with `parse_workers`
+    processes if `parse_in_processes` is `True`. Write stage saves articles
+    in batches of `write_batch_size` articles, or every `write_delay` seconds
+    if batch is not full.
+
+    If `page_store` is specified, downloaded pages are saved to it in
+    default thread pool of event loop.
+
+    Downloads failed with transient errors are retried with `retry_policy`.
+    If download still fails, article is not saved, so it is fetched again
+    next time, and it is counted in `failed_count`.
+
+    Articles are read from asynchronous iterable by feed stage, so they can be
+    loaded from database in chunks while previous articles are processed.
+    """
+
+    module: SourceModule
+    session: 'aiohttp.ClientSession'
+    download_workers: int
+    parse_workers: int
+    parse_in_processes: bool
+    write_batch_size: int
+    write_delay: float
+    on_article_done: Callable[[models.FetchedArticle], None]
+    retry_policy: RetryPolicy
+    page_store: Optional['PageStore']
+    failed_count: int
+
+    def __init__(
+        self, module: SourceModule, session: 'aiohttp.ClientSession',
+        download_workers: int, parse_workers: int, write_batch_size: int,
+        on_article_done: Callable[[models.FetchedArticle], None] = (
+            lambda _: None
+        ),
+        parse_in_processes: bool = False, write_delay: float = 1.0,
+        retry_policy: RetryPolicy = NO_RETRY_POLICY,
+        page_store: Optional['PageStore'] = None
+    ):
+        self.module = module
+        self.session = session
+        self.download_workers = download_workers
+        self.parse_workers = parse_workers
+        self.parse_in_processes = parse_in_processes
+        self.write_batch_size = write_batch_size
+        self.write_delay = write_delay
+        self.on_article_done = on_article_done
+        self.retry_policy = retry_policy
+        self.page_store = page_store
+        self.failed_count = 0
+
+    def create_parse_executor(self) -> concurrent.futures.Executor:
+        if self.parse_in_processes:
+            return concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.parse_workers,
+                initializer=init_parse_worker, initargs=(self.module,)
+            )
+        return concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.parse_workers
+        )
+
+    def get_extract_function(self) -> Callable[[str, str], ArticleContent]:
+        if self.parse_in_processes:
+            return extract_article_in_worker
+        return self.module.extract_article
+
+    async def run(
+        self, articles: AsyncIterable[models.FetchedArticle]
+    ) -> None:
+        """Fetch all articles and save them in database."""
+        download_queue: 'ArticleQueue' = (
+            asyncio.Queue(maxsize=2 * self.download_workers)
+        )
+        parse_queue: 'ParseQueue' = (
+            asyncio.Queue(maxsize=2 * self.parse_workers)
+        )
+        write_queue: 'WriteQueue' = (
+            asyncio.Queue(maxsize=2 * self.write_batch_size)
+        )
+
+        with self.create_parse_executor() as executor:
+            tasks = [
+                asyncio.ensure_future(self.feed_stage(
+                    articles, download_queue
+                )),
+                asyncio.ensure_future(self.download_stage(
+                    download_queue, parse_queue, write_queue
+                )),
+                asyncio.ensure_future(self.parse_stage(
+                    executor, parse_queue, write_queue
+                )),
+                asyncio.ensure_future(self.write_stage(write_queue)),
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+                # Wait for write stage to save collected articles
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def feed_stage(
+        self, articles: AsyncIterable[models.FetchedArticle],
+        download_queue: 'ArticleQueue'
+    ) -> None:
+        async for article in articles:
+            await download_queue.put(article)
+        for _ in range(self.download_workers):
+            await download_queue.put(None)
+
+    async def download_stage(
+        self, download_queue: 'ArticleQueue',
+        parse_queue: 'ParseQueue',
+        write_queue: 'WriteQueue'
+    ) -> None:
+        async def worker() -> None:
+            while True:
+                article = await download_queue.get()
+                if article is None:
+                    return
+                html: Optional[str] = None
+                if article.source_url_ok is not False:
+                    try:
+                        html = await self.retry_policy.run(
+                            functools.partial(
+                                self.module.download_article, article,
+                                self.session
+                            )
+                        )
+                    except REQUEST_ERRORS:
+                        self.failed_count += 1
+                        self.on_article_done(article)
+                        continue
+                if html is None:
+                    await write_queue.put((article, None))
+                else:
+                    await parse_queue.put((article, html))
+
+        await asyncio.gather(
+            *(worker() for _ in range(self.download_workers))
+        )
+        for _ in range(self.parse_workers):
+            await parse_queue.put(None)
+
+    async def parse_stage(
+        self, executor: concurrent.futures.Executor,
+        parse_queue: 'ParseQueue',
+        write_queue: 'WriteQueue'
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        extract_article = self.get_extract_function()
+
+        async def worker() -> None:
+            while True:
+                item = await parse_queue.get()
+                if item is None:
+                    return
+                article, html = item
+                content = await loop.run_in_executor(
+                    executor, extract_article, article.source_url, html
+                )
+                content.apply(article)
+                page_hash: Optional[str] = None
+                if self.page_store is not None:
+                    page_hash = await loop.run_in_executor(
+                        None, self.page_store.save, html
+                    )
+                await write_queue.put((article, page_hash))
+
+        await asyncio.gather(*(worker() for _ in range(self.parse_workers)))
+        await write_queue.put(None)
+
+    async def write_stage(
+        self, write_queue: 'WriteQueue'
+    ) -> None:
+        async with ArticleWriteBuffer(
+            ARTICLE_CONTENT_FIELDS, self.write_batch_size, self.write_delay
+        ) as write_buffer:
+            while True:
+                item = await write_queue.get()
+                if item is None:
+                    return
+                article, page_hash = item
+                await write_buffer.add(article, page_hash)
+                self.on_article_done(article)
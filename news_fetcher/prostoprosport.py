@@ -3,18 +3,20 @@ import dataclasses
 import datetime
 import json
 import urllib
-from typing import Dict, Iterable, List, Optional, Set, TextIO, Tuple, Union
+from typing import (TYPE_CHECKING, Container, Dict, Iterable, List, Optional,
+                    Set, TextIO, Tuple, Union)
 
-import aiohttp
-import bs4
 import click
 
 import models
-from module import SourceModule
+from module import ArticleContent, SourceModule
 from utils import (check_dict_str_str, check_int, check_list_dict_str_object,
                    check_list_str, check_str)
 from wikitext import html_to_wikitext
 
+if TYPE_CHECKING:
+    import aiohttp
+
 PROSTOPROSPORT_API_NEWS_URL = 'https://api.prostoprosport.ru/api/news/'
 PROSTOPROSPORT_API_MAIN_NEWS_URL = (
     'https://api.prostoprosport.ru/api/main_news/'
@@ -135,25 +137,32 @@ class ProstoprosportModule(SourceModule):
         self.api_url = get_api_url(api_method)
 
     async def fetch_news(
-        self, session: aiohttp.ClientSession, page: int, source: models.Source
+        self, session: 'aiohttp.ClientSession', page: int,
+        source: models.Source,
+        known_slug_names: Container[str] = frozenset()
     ) -> Tuple[Iterable[models.Article], Dict[str, Set[str]]]:
+        from client import HTTPStatusError
         params = {
             'offset': 1,
             'page': page
         }
         async with session.get(self.api_url, params=params) as response:
+            if response.status >= 400:
+                raise HTTPStatusError(response.status)
             data = await response.json()
 
         tag_titles_by_slug_name: Dict[str, Set[str]] = {}
 
         articles: List[models.Article] = []
         for element in data:
-            title_str = element['post_title']
-            if not isinstance(title_str, str):
-                raise ValueError()
             name_str = element['post_name']
             if not isinstance(name_str, str):
                 raise ValueError()
+            if name_str in known_slug_names:
+                continue
+            title_str = element['post_title']
+            if not isinstance(title_str, str):
+                raise ValueError()
             date_str = element['post_date'][:-1]
             if not isinstance(date_str, str):
                 raise ValueError()
@@ -174,10 +183,7 @@ class ProstoprosportModule(SourceModule):
                     category_title = tag['category']['name']
                 elif 'post_tag' in tag:
                     tag_titles.append(tag['post_tag']['name'])
-            if len(tag_titles_by_slug_name) != 0:
-                tag_titles_by_slug_name[name_str] = set(filter(
-                    bool, tag_titles
-                ))
+            tag_titles_by_slug_name[name_str] = set(filter(bool, tag_titles))
 
             if category_id is None:
                 raise ValueError()
@@ -195,48 +201,38 @@ class ProstoprosportModule(SourceModule):
                 date=date, title=title_str,
                 source_url=misc_data.get_page_url(
                     name_str, self.categories_by_id, self.categories_by_slug
-                )
+                ),
+                misc_data=misc_data.to_json_dict()
             ))
 
         return articles, tag_titles_by_slug_name
 
-    async def fetch_article(
-        self, article: models.Article, session: aiohttp.ClientSession
-    ) -> None:
-        if not article.source_url_ok:
-            return  # TODO
-
-        async with session.get(article.source_url) as response:
-            if response.status == 404:
-                article.source_url_ok = False
-                return
-            if response.status != 200:
-                raise ValueError(response.status)
-            parser = bs4.BeautifulSoup(
-                markup=await response.text(), features='html.parser'
-            )
+    def extract_article(self, source_url: str, html: str) -> ArticleContent:
+        backend = self.parser_backend
+        document = backend.parse(html)
 
-        author_tags = parser.select('.author > form > button')
+        author_tags = backend.select(document, '.author > form > button')
         author_name: Optional[str] = None
         if len(author_tags) >= 1:
-            author_name = author_tags[0].text
-        paragraph_tags = parser.select('.page-content > article > p')
+            author_name = backend.get_text(author_tags[0])
+        paragraph_tags = backend.select(
+            document, '.page-content > article > p'
+        )
         wikitext_paragraphs: List[str] = []
         for paragraph_tag in paragraph_tags:
             wikitext = html_to_wikitext(
                 paragraph_tag,
                 lambda href:
-                urllib.parse.urljoin(href, PROSTOPROSPORT_WEBSITE_URL)
+                urllib.parse.urljoin(href, PROSTOPROSPORT_WEBSITE_URL),
+                backend=backend
             )
             wikitext_paragraphs.append(wikitext)
 
-        if author_name is not None:
-            article.author_name = author_name
-        article.wikitext_paragraphs = wikitext_paragraphs
-        await article.save()
+        return ArticleContent(author_name, wikitext_paragraphs)
 
-    async def get_wiki_page_text(
-        self, article: models.Article, bot_name: str
+    def render_wiki_page_text(
+        self, article: models.RenderedArticle, bot_name: str,
+        tag_titles: Iterable[str]
     ) -> Optional[str]:
         if article.wikitext_paragraphs is None:
             return None
@@ -256,14 +252,12 @@ class ProstoprosportModule(SourceModule):
         except KeyError:
             return None
 
-        tag_titles = sorted(map(
-            lambda tag: tag.title, await article.tags.all()
-        ))
+        sorted_tag_titles = sorted(tag_titles)
         tag_titles_list: List[str]
         if misc_data.category_title is None:
-            full_tag_titles = tag_titles
+            full_tag_titles = sorted_tag_titles
         else:
-            full_tag_titles = [misc_data.category_title] + tag_titles
+            full_tag_titles = [misc_data.category_title] + sorted_tag_titles
         tag_titles_str = '|'.join(full_tag_titles)
         wikitext_elements: List[str] = []
 
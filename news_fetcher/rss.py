@@ -1,46 +1,186 @@
+import asyncio
+import datetime
+import hashlib
 import json
 import urllib.parse
+import xml.etree.ElementTree
 from io import BytesIO
-from typing import (Dict, FrozenSet, Iterable, List, Optional, Set, TextIO,
-                    Tuple)
-
-import aiohttp
-import bs4
-import feedparser
+from typing import (TYPE_CHECKING, Any, AsyncIterator, Container, Dict,
+                    FrozenSet, Iterable, List, Optional, Set, TextIO, Tuple,
+                    cast)
 
 import models
-from module import SourceModule
+from module import ArticleContent, SourceModule
 from utils import (check_bool, check_dict_str_object, check_int,
                    check_list_str, check_optional_str, check_str,
                    struct_time_to_datetime)
 from wikitext import html_to_wikitext
 
+if TYPE_CHECKING:
+    import aiohttp
+    import feedparser
+
+# Keys of feed entry which are saved in `misc_data` field of article, other
+# data is saved in article fields or is not used
+MISC_DATA_KEYS = ('id', 'summary', 'published', 'updated')
+
+
+# Date keys of feed entry, feedparser parses them to `struct_time` in UTC
+# with `_parsed` suffix
+ENTRY_DATE_KEYS = ('created', 'expired', 'published', 'updated')
+
+# Suffix of keys with dates of feed entry converted to `datetime`
+DATETIME_KEY_SUFFIX = '_datetime'
+
+# Local names of elements with feed entries in RSS and Atom feeds
+ENTRY_TAG_NAMES = ('item', 'entry')
+
+# Size of chunks of response data to parse feed in streaming mode
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def normalize_entry_dates(
+    entries: Iterable['feedparser.util.FeedParserDict']
+) -> None:
+    """
+    Convert parsed dates of feed entries to timezone-aware datetimes.
+
+    Every date is converted once and cached in entry with `_datetime`
+    suffix (e.g. `published_datetime`), entries which already have cached
+    dates are skipped.
+    """
+    parsed_keys = [
+        (date_key + '_parsed', date_key + DATETIME_KEY_SUFFIX)
+        for date_key in ENTRY_DATE_KEYS
+    ]
+    # `FeedParserDict` methods are slow because they map key aliases, so
+    # `dict` methods are used for keys without aliases
+    get_item = dict.get
+    set_item = dict.__setitem__
+    for entry in entries:
+        for parsed_key, datetime_key in parsed_keys:
+            value = get_item(entry, parsed_key)
+            if (value is not None) and (get_item(entry, datetime_key) is None):
+                set_item(entry, datetime_key, struct_time_to_datetime(value))
+
+
+def get_entry_date(
+    entry: 'feedparser.util.FeedParserDict'
+) -> Optional[datetime.datetime]:
+    """
+    Get publication date of feed entry, or update date if it is missing.
+
+    Dates should be normalized with `normalize_entry_dates`. Return `None`
+    if entry has no dates.
+    """
+    for date_key in ('published', 'updated'):
+        value = dict.get(entry, date_key + DATETIME_KEY_SUFFIX)
+        if value is not None:
+            return cast(datetime.datetime, value)
+    return None
+
 
 def entry_to_json_dict(
-    data: feedparser.util.FeedParserDict
+    data: 'feedparser.util.FeedParserDict'
 ) -> Dict[str, object]:
-    tmp_dict = dict(data)
-    if 'created_parsed' in data:
-        tmp_dict['created_parsed'] = (
-            struct_time_to_datetime(tmp_dict['created_parsed']).isoformat()
-        )
-    if 'expired_parsed' in data:
-        tmp_dict['expired_parsed'] = (
-            struct_time_to_datetime(tmp_dict['expired_parsed']).isoformat()
-        )
-    if 'published_parsed' in data:
-        tmp_dict['published_parsed'] = (
-            struct_time_to_datetime(tmp_dict['published_parsed']).isoformat()
-        )
-    if 'updated_parsed' in data:
-        tmp_dict['updated_parsed'] = (
-            struct_time_to_datetime(tmp_dict['updated_parsed']).isoformat()
+    """
+    Convert feed entry to dictionary which can be saved as JSON.
+
+    Parsed dates are saved in ISO format.
+    """
+    normalize_entry_dates([data])
+    json_dict = dict(data)
+    for date_key in ENTRY_DATE_KEYS:
+        value = json_dict.pop(date_key + DATETIME_KEY_SUFFIX, None)
+        if value is not None:
+            json_dict[date_key + '_parsed'] = value.isoformat()
+    return json_dict
+
+
+class FeedEntryStream:
+    """
+    Incremental parser of RSS or Atom feed.
+
+    Feed data is fed in chunks to XML pull parser. Entries (`item` or
+    `entry` elements) which are closed in every chunk are parsed by
+    feedparser together, and then removed from document tree, so only
+    entries of one chunk are kept in memory. Feed should be well-formed
+    XML, unlike feed parsed by feedparser at once.
+    """
+
+    parser: 'xml.etree.ElementTree.XMLPullParser[Any]'
+    open_elements: List[xml.etree.ElementTree.Element]
+    started: bool
+
+    def __init__(self) -> None:
+        self.parser = xml.etree.ElementTree.XMLPullParser(
+            events=('start', 'end')
         )
-    return tmp_dict
+        self.open_elements = []
+        self.started = False
+
+    def feed(self, data: bytes) -> List['feedparser.util.FeedParserDict']:
+        """Feed chunk of data, return entries which are parsed."""
+        if not self.started:
+            # XML declaration should be at start of data
+            data = data.lstrip()
+            if len(data) == 0:
+                return []
+            self.started = True
+        self.parser.feed(data)
+        return self.read_entries()
+
+    def close(self) -> List['feedparser.util.FeedParserDict']:
+        """Finish parsing, return entries which are parsed."""
+        try:
+            self.parser.close()
+        except xml.etree.ElementTree.ParseError as exc:
+            raise ValueError(f'Invalid feed XML: {exc}')
+        return self.read_entries()
+
+    def read_entries(self) -> List['feedparser.util.FeedParserDict']:
+        import feedparser
+
+        entry_texts: List[str] = []
+        try:
+            events = cast(
+                List[Tuple[str, xml.etree.ElementTree.Element]],
+                list(self.parser.read_events())
+            )
+        except xml.etree.ElementTree.ParseError as exc:
+            raise ValueError(f'Invalid feed XML: {exc}')
+        for event, element in events:
+            if event == 'start':
+                self.open_elements.append(element)
+                continue
+            self.open_elements.pop()
+            if (
+                (element.tag.rpartition('}')[2] in ENTRY_TAG_NAMES)
+                and (len(self.open_elements) != 0)
+            ):
+                entry_texts.append(xml.etree.ElementTree.tostring(
+                    element, encoding='unicode'
+                ))
+                self.open_elements[-1].remove(element)
+        if len(entry_texts) == 0:
+            return []
+        # Entries are wrapped in RSS 2.0 feed, feedparser detects entry
+        # format by element namespaces
+        entries = feedparser.parse(
+            '<rss version="2.0"><channel>' + ''.join(entry_texts)
+            + '</channel></rss>'
+        ).entries
+        normalize_entry_dates(entries)
+        return list(entries)
 
 
 class RSSModule(SourceModule):
     rss_url: str
+    # URLs of all feeds of source, `rss_url` is first
+    rss_urls: List[str]
+    # Template of URLs of next pages of feeds with `{url}` (feed URL) and
+    # `{page}` placeholders, `None` if feeds have only one page
+    page_url_template: Optional[str]
     source_title: str
     css_selector: str
     replaceable_netlocs: FrozenSet[str]
@@ -48,12 +188,23 @@ class RSSModule(SourceModule):
     removed_last_lines: int
     disable_bold_font: bool
     extra_first_lines: List[str]
+    # Number of articles in batch in streaming mode, `None` if feed is parsed
+    # at once
+    stream_batch_size: Optional[int]
+    wiki_page_uses_misc_data = False
+    # Feed cache state and slug names of new articles for every feed URL
+    # fetched by `fetch_news`, state is saved by `save_news` after all new
+    # articles of feed are saved
+    feed_cache_updates: Dict[
+        str, Tuple[Dict[str, Optional[str]], FrozenSet[str]]
+    ]
 
     def __init__(
         self, config_file: TextIO, rss_url: str, source_slug_name: str
     ):
         self.rss_url = rss_url
         self.source_slug_name = source_slug_name
+        self.feed_cache_updates = {}
         config_data = check_dict_str_object(json.load(config_file))
         self.source_title = check_str(config_data.get('source_title'))
         self.css_selector = check_str(config_data.get('css_selector'))
@@ -88,43 +239,290 @@ class RSSModule(SourceModule):
             )
         else:
             self.extra_first_lines = []
+        if 'stream_batch_size' in config_data:
+            self.stream_batch_size = check_int(
+                config_data['stream_batch_size']
+            )
+            if self.stream_batch_size < 1:
+                raise ValueError('stream_batch_size should be positive')
+            self.streams_news = True
+        else:
+            self.stream_batch_size = None
+        self.rss_urls = [rss_url]
+        if 'extra_rss_urls' in config_data:
+            self.rss_urls += check_list_str(config_data['extra_rss_urls'])
+        self.page_url_template = check_optional_str(
+            config_data.get('page_url_template')
+        )
+        if self.page_url_template is not None:
+            try:
+                self.page_url_template.format(url=rss_url, page=2)
+            except (KeyError, IndexError, ValueError):
+                raise ValueError(
+                    'page_url_template should have only {url} and {page} '
+                    'placeholders'
+                )
+
+    def get_feed_urls(self, page: int) -> List[str]:
+        """
+        Get URLs of feed pages for page number.
+
+        First page is feeds themselves. If there is no page URL template,
+        feeds have no other pages.
+        """
+        if page <= 1:
+            return self.rss_urls
+        if self.page_url_template is None:
+            return []
+        return [
+            self.page_url_template.format(url=url, page=page)
+            for url in self.rss_urls
+        ]
+
+    def get_request_headers(
+        self, feed_cache: Optional[models.FeedCache]
+    ) -> Dict[str, str]:
+        """Get headers for conditional request of feed."""
+        headers: Dict[str, str] = {}
+        if feed_cache is not None:
+            if feed_cache.etag is not None:
+                headers['If-None-Match'] = feed_cache.etag
+            if feed_cache.last_modified is not None:
+                headers['If-Modified-Since'] = feed_cache.last_modified
+        return headers
+
+    def add_entry(
+        self, element: 'feedparser.util.FeedParserDict',
+        source: models.Source, known_slug_names: Container[str],
+        articles: List[models.Article],
+        tag_titles_by_slug_name: Dict[str, Set[str]]
+    ) -> None:
+        """
+        Create article model and tag titles from feed entry.
+
+        Entries with known slug names, entries which are already added
+        (e.g. from other feed) and entries without publication and update
+        dates are skipped.
+        """
+        slug_name = element.link  # TODO
+        if (
+            (slug_name in known_slug_names)
+            or (slug_name in tag_titles_by_slug_name)
+        ):
+            return
+        date = get_entry_date(element)
+        if date is None:
+            return
+        author_name: Optional[str] = None
+        if 'author' in element:
+            author_name = element.author
+        tag_titles = set(self.default_categories)
+        if 'tags' in element:
+            tag_titles = tag_titles.union(
+                set(filter(
+                    bool,
+                    map(lambda tag_data: tag_data.term, element.tags)
+                ))
+            )
+        tag_titles_by_slug_name[slug_name] = tag_titles
+        articles.append(models.Article(
+            source=source,
+            slug_name=slug_name,
+            title=element.title,
+            source_url=element.link,
+            date=date,
+            author_name=author_name,
+            misc_data=self.compact_misc_data(element)
+        ))
+
+    def set_feed_cache_update(
+        self, url: str, response: 'aiohttp.ClientResponse',
+        content_hash: str, slug_names: Iterable[str]
+    ) -> None:
+        """
+        Remember feed cache state of feed to save it with its articles.
+
+        State is saved by `save_news` when all articles with `slug_names` are
+        saved, so feed is fetched again if they are not saved.
+        """
+        self.feed_cache_updates[url] = (
+            {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'content_hash': content_hash
+            },
+            frozenset(slug_names)
+        )
+
+    async def fetch_feed(
+        self, session: 'aiohttp.ClientSession', url: str,
+        source: models.Source, known_slug_names: Container[str]
+    ) -> List['feedparser.util.FeedParserDict']:
+        """
+        Fetch and parse one feed, return its entries.
+
+        Feed is requested with `If-None-Match` and `If-Modified-Since`
+        headers from previous response, and it is not parsed if server
+        returns 304 or feed content is not changed. `HTTPStatusError` is
+        raised if server returns error status.
+        """
+        import feedparser
+
+        from client import HTTPStatusError
+
+        feed_cache = await models.FeedCache.get_or_none(
+            source=source, url=url
+        )
+        headers = self.get_request_headers(feed_cache)
+
+        async with session.get(url, headers=headers) as response:
+            if response.status == 304:
+                return []
+            if response.status >= 400:
+                raise HTTPStatusError(response.status)
+            text = await response.read()
+            content_hash = hashlib.sha256(text).hexdigest()
+            if (
+                (response.status == 200) and (feed_cache is not None)
+                and (feed_cache.content_hash == content_hash)
+            ):
+                return []
+            parsed_feed = feedparser.parse(BytesIO(text))
+            normalize_entry_dates(parsed_feed.entries)
+            if response.status == 200:
+                self.set_feed_cache_update(
+                    url, response, content_hash,
+                    (
+                        element.link for element in parsed_feed.entries
+                        if (element.link not in known_slug_names)
+                        and (get_entry_date(element) is not None)
+                    )
+                )
+        return list(parsed_feed.entries)
 
     async def fetch_news(
-        self, session: aiohttp.ClientSession, page: int, source: models.Source
+        self, session: 'aiohttp.ClientSession', page: int,
+        source: models.Source,
+        known_slug_names: Container[str] = frozenset()
     ) -> Tuple[Iterable[models.Article], Dict[str, Set[str]]]:
-        # TODO: page is ignored: maybe should warn about it
+        """
+        Fetch news from page of all RSS feeds.
+
+        Feeds are fetched concurrently with `fetch_feed`, and their entries
+        are de-duplicated by slug name.
+        """
         articles: List[models.Article] = []
         tag_titles_by_slug_name: Dict[str, Set[str]] = {}
 
-        async with session.get(self.rss_url) as response:
-            text = await response.read()
-            parsed_feed = feedparser.parse(BytesIO(text))
-            for element in parsed_feed.entries:
-                slug_name = element.link  # TODO
-                author_name: Optional[str] = None
-                if 'author' in element:
-                    author_name = element.author
-                tag_titles = set(self.default_categories)
-                if 'tags' in element:
-                    tag_titles = tag_titles.union(
-                        set(filter(
-                            bool,
-                            map(lambda tag_data: tag_data.term, element.tags)
-                        ))
-                    )
-                tag_titles_by_slug_name[slug_name] = tag_titles
-                articles.append(models.Article(
-                    source=source,
-                    slug_name=slug_name,
-                    title=element.title,
-                    source_url=element.link,
-                    date=struct_time_to_datetime(element.published_parsed),
-                    author_name=author_name,
-                    misc_data=entry_to_json_dict(element)  # TODO
-                ))
+        feeds = await asyncio.gather(*(
+            self.fetch_feed(session, url, source, known_slug_names)
+            for url in self.get_feed_urls(page)
+        ))
+        for entries in feeds:
+            for element in entries:
+                self.add_entry(
+                    element, source, known_slug_names, articles,
+                    tag_titles_by_slug_name
+                )
 
         return articles, tag_titles_by_slug_name
 
+    async def fetch_news_batches(
+        self, session: 'aiohttp.ClientSession', page: int,
+        source: models.Source,
+        known_slug_names: Container[str] = frozenset()
+    ) -> AsyncIterator[Tuple[Iterable[models.Article], Dict[str, Set[str]]]]:
+        """
+        Fetch news from RSS feeds in batches if streaming is enabled.
+
+        Feeds of page are fetched one by one. Response is read in chunks and
+        parsed incrementally, batch is yielded as soon as
+        `stream_batch_size` new articles are parsed, so whole feed is not
+        kept in memory. Feed is not parsed if server returns 304. Feed
+        content hash is known only after it is parsed, so feed cache is
+        updated with last batch.
+        """
+        if self.stream_batch_size is None:
+            async for batch in super().fetch_news_batches(
+                session, page, source, known_slug_names
+            ):
+                yield batch
+            return
+
+        from client import HTTPStatusError
+
+        articles: List[models.Article] = []
+        tag_titles_by_slug_name: Dict[str, Set[str]] = {}
+
+        for url in self.get_feed_urls(page):
+            feed_cache = await models.FeedCache.get_or_none(
+                source=source, url=url
+            )
+            headers = self.get_request_headers(feed_cache)
+
+            async with session.get(url, headers=headers) as response:
+                if response.status == 304:
+                    continue
+                if response.status >= 400:
+                    raise HTTPStatusError(response.status)
+                stream = FeedEntryStream()
+                content_hash = hashlib.sha256()
+                async for chunk in response.content.iter_chunked(
+                    STREAM_CHUNK_SIZE
+                ):
+                    content_hash.update(chunk)
+                    for element in stream.feed(chunk):
+                        self.add_entry(
+                            element, source, known_slug_names, articles,
+                            tag_titles_by_slug_name
+                        )
+                        if len(articles) >= self.stream_batch_size:
+                            yield articles, tag_titles_by_slug_name
+                            articles = []
+                            tag_titles_by_slug_name = {}
+                for element in stream.close():
+                    self.add_entry(
+                        element, source, known_slug_names, articles,
+                        tag_titles_by_slug_name
+                    )
+                if (response.status == 200) and (
+                    (feed_cache is None)
+                    or (feed_cache.content_hash != content_hash.hexdigest())
+                ):
+                    # Previous batches are already saved
+                    self.set_feed_cache_update(
+                        url, response, content_hash.hexdigest(),
+                        tag_titles_by_slug_name.keys()
+                    )
+
+        yield articles, tag_titles_by_slug_name
+
+    async def save_news(
+        self, source: models.Source, articles: Iterable[models.Article],
+        tag_titles_by_slug_name: Dict[str, Set[str]]
+    ) -> None:
+        articles = list(articles)
+        await super().save_news(source, articles, tag_titles_by_slug_name)
+        saved_slug_names = {article.slug_name for article in articles}
+        for url, (feed_cache_update, slug_names) in list(
+            self.feed_cache_updates.items()
+        ):
+            if not slug_names.issubset(saved_slug_names):
+                continue
+            await models.FeedCache.update_or_create(
+                feed_cache_update, source=source, url=url
+            )
+            del self.feed_cache_updates[url]
+
+    def compact_misc_data(self, misc_data: Any) -> Any:
+        """Keep only `MISC_DATA_KEYS` keys of feed entry."""
+        if not isinstance(misc_data, dict):
+            return misc_data
+        return {
+            key: value for key, value in misc_data.items()
+            if key in MISC_DATA_KEYS
+        }
+
     def handle_link(
         self, base_url: urllib.parse.ParseResult, href: str
     ) -> str:
@@ -138,44 +536,37 @@ class RSSModule(SourceModule):
             ).geturl()
         return href
 
-    async def fetch_article(
-        self, article: models.Article, session: aiohttp.ClientSession
-    ) -> None:
-        """
-        Fetch article text and save it in database.
-        """
-        if not article.source_url_ok:
-            return  # TODO
-
-        async with session.get(article.source_url) as response:
-            if response.status == 404:
-                article.source_url_ok = False
-                return
-            if response.status != 200:
-                raise ValueError(response.status)
-            parser = bs4.BeautifulSoup(
-                markup=await response.text(), features='html.parser'
-            )
-
-        paragraph_tags = parser.select(self.css_selector)
+    def extract_article(self, source_url: str, html: str) -> ArticleContent:
+        backend = self.parser_backend
+        paragraph_tags = backend.select(
+            backend.parse(html), self.css_selector
+        )
         wikitext_paragraphs: List[str] = []
 
-        base_url = urllib.parse.urlparse(article.source_url)._replace(
+        base_url = urllib.parse.urlparse(source_url)._replace(
             path='', query='', fragment=''
         )
 
         for paragraph_tag in paragraph_tags:
             wikitext = html_to_wikitext(
                 paragraph_tag, lambda href: self.handle_link(base_url, href),
-                disable_bold_font=self.disable_bold_font
+                disable_bold_font=self.disable_bold_font, backend=backend
             )
             wikitext_paragraphs.append(wikitext)
 
-        article.wikitext_paragraphs = wikitext_paragraphs
-        await article.save()
+        return ArticleContent(None, wikitext_paragraphs)
+
+    def get_wiki_page_config(self) -> Dict[str, object]:
+        return {
+            'source_title': self.source_title,
+            'source_template_name': self.source_template_name,
+            'removed_last_lines': self.removed_last_lines,
+            'extra_first_lines': self.extra_first_lines
+        }
 
-    async def get_wiki_page_text(
-        self, article: models.Article, bot_name: str
+    def render_wiki_page_text(
+        self, article: models.RenderedArticle, bot_name: str,
+        tag_titles: Iterable[str]
     ) -> Optional[str]:
         """Get wiki-page text for article from wiki-text paragraphs."""
         if article.wikitext_paragraphs is None:
@@ -192,10 +583,8 @@ class RSSModule(SourceModule):
 
         date_str = article.date.strftime('%Y-%m-%d')
 
-        tag_titles = sorted(map(
-            lambda tag: tag.title, await article.tags.all()
-        ))
-        tag_titles_str = '|'.join(tag_titles)
+        sorted_tag_titles = sorted(tag_titles)
+        tag_titles_str = '|'.join(sorted_tag_titles)
         wikitext_elements: List[str] = []
 
         wikitext_elements.extend(self.extra_first_lines)
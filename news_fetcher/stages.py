@@ -0,0 +1,720 @@
+"""Stages of news processing which are run by command line commands."""
+import asyncio
+import concurrent.futures
+import functools
+import io
+import pathlib
+import re
+import time
+from typing import (TYPE_CHECKING, Any, AsyncIterator, Dict, Iterable, List,
+                    Optional, Set, TextIO, Tuple, Type, TypeVar)
+
+import click
+import tortoise
+from tortoise.expressions import Q
+from tortoise.queryset import QuerySet
+
+import models
+from concurrency import map_ordered
+from db import iterate_article_value_chunks, iterate_raw_article_chunks
+from module import ARTICLE_CONTENT_FIELDS, SourceModule
+from utils import JSONObjectWriter
+from write_buffer import ArticleWriteBuffer, get_db_values, get_update_sql
+
+# HTTP client and pipeline are imported only by stages which download web
+# pages, so that other commands start faster
+if TYPE_CHECKING:
+    from client import RetryPolicy, SessionFactory
+    from page_store import PageStore
+
+    # Page number, articles and tag titles by slug name
+    NewsPage = Tuple[int, List[models.Article], Dict[str, Set[str]]]
+
+TAG_QUERY_BATCH_SIZE = 500
+
+# Number of content hashes in one query to delete evicted stored pages
+STORED_PAGE_QUERY_BATCH_SIZE = 500
+
+# Command name which is used to record completed pages
+FETCH_NEWS_COMMAND = 'fetch-news'
+
+RowT = TypeVar('RowT', models.ArticleFetchRow, models.ArticlePageRow)
+
+
+def create_progressbar(length: int, show_progress: bool = True) -> Any:
+    """Create progress bar which is not shown if `show_progress` is False."""
+    return click.progressbar(
+        length=length, file=None if show_progress else io.StringIO()
+    )
+
+
+async def fetch_news_async(
+    module: SourceModule, first_page: int, last_page: int,
+    concurrency: int = 1, early_stop: bool = False,
+    show_progress: bool = True,
+    session_factory: Optional['SessionFactory'] = None,
+    retry_policy: Optional['RetryPolicy'] = None, resume: bool = False
+) -> None:
+    """
+    Fetch news pages and save new articles.
+
+    Slug names of source articles are loaded once, and source module skips
+    known articles before creating models. In early stop mode pages are
+    fetched from most recent, and fetching stops at first page without new
+    articles, then new pages are saved from least recent.
+
+    If source module streams news, pages are fetched one by one, and every
+    batch of articles is saved as soon as it is fetched, so that whole page
+    is not kept in memory. In early stop mode pages are saved from most
+    recent in this case.
+
+    Every saved page is recorded as completed, and if `resume` is `True`,
+    pages completed by previous interrupted run are skipped. Completed pages
+    are forgotten when all pages are fetched.
+    """
+    from client import NO_RETRY_POLICY, SessionFactory
+    session_factory = session_factory or SessionFactory()
+    retry_policy = retry_policy or NO_RETRY_POLICY
+
+    source, _ = await models.Source.get_or_create(
+        slug_name=module.source_slug_name
+    )
+    known_slug_names: Set[str] = {
+        slug_name for slug_name, in await source.articles.all().values_list(
+            'slug_name'
+        )
+    }
+    completed_page_query = models.CompletedPage.filter(
+        source=source, command=FETCH_NEWS_COMMAND
+    )
+    completed_pages: Set[int] = set()
+    if resume:
+        completed_pages.update(
+            page for page, in await completed_page_query.values_list('page')
+        )
+    else:
+        await completed_page_query.delete()
+
+    if early_stop:
+        all_pages = range(first_page, last_page + 1)
+    else:
+        all_pages = range(last_page, first_page - 1, -1)
+    pages = [page for page in all_pages if page not in completed_pages]
+
+    async with session_factory.create_session() as session:
+        async def fetch_page(page: int) -> 'NewsPage':
+            articles, tag_titles_by_slug_name = await retry_policy.run(
+                functools.partial(
+                    module.fetch_news, session, page, source, known_slug_names
+                )
+            )
+            return page, list(articles), tag_titles_by_slug_name
+
+        async def save_page(
+            page: int, articles: List[models.Article],
+            tag_titles_by_slug_name: Dict[str, Set[str]]
+        ) -> None:
+            await module.save_news(source, articles, tag_titles_by_slug_name)
+            known_slug_names.update(article.slug_name for article in articles)
+            await models.CompletedPage.create(
+                source=source, command=FETCH_NEWS_COMMAND, page=page
+            )
+
+        async def fetch_and_save_page(page: int) -> int:
+            article_count = 0
+            batches = module.fetch_news_batches(
+                session, page, source, known_slug_names
+            )
+            async for articles, tag_titles_by_slug_name in batches:
+                articles = list(articles)
+                await module.save_news(
+                    source, articles, tag_titles_by_slug_name
+                )
+                known_slug_names.update(
+                    article.slug_name for article in articles
+                )
+                article_count += len(articles)
+            await models.CompletedPage.create(
+                source=source, command=FETCH_NEWS_COMMAND, page=page
+            )
+            return article_count
+
+        if module.streams_news:
+            with create_progressbar(len(pages), show_progress) as bar1:
+                for page in pages:
+                    article_count = await retry_policy.run(
+                        functools.partial(fetch_and_save_page, page)
+                    )
+                    bar1.update(1)
+                    if early_stop and (article_count == 0):
+                        break
+            await completed_page_query.delete()
+            return
+
+        new_pages: List['NewsPage'] = []
+        with create_progressbar(len(pages), show_progress) as bar1:
+            results = map_ordered(fetch_page, pages, concurrency)
+            try:
+                async for page, articles, tag_titles_by_slug_name in results:
+                    bar1.update(1)
+                    if not early_stop:
+                        await save_page(
+                            page, articles, tag_titles_by_slug_name
+                        )
+                    elif len(articles) == 0:
+                        break
+                    else:
+                        new_pages.append(
+                            (page, articles, tag_titles_by_slug_name)
+                        )
+            finally:
+                await results.aclose()
+        for page, articles, tag_titles_by_slug_name in reversed(new_pages):
+            await save_page(page, articles, tag_titles_by_slug_name)
+    await completed_page_query.delete()
+
+
+async def fetch_news_pages_async(
+    module: SourceModule, pipeline: bool = False,
+    download_concurrency: int = 1, parse_concurrency: int = 1,
+    write_batch_size: int = 1, limit_per_host: Optional[int] = None,
+    parse_processes: int = 0, chunk_size: int = 500,
+    write_delay: float = 1.0, show_progress: bool = True,
+    session_factory: Optional['SessionFactory'] = None,
+    retry_policy: Optional['RetryPolicy'] = None,
+    page_store: Optional['PageStore'] = None
+) -> None:
+    """
+    Fetch articles which are not fetched yet.
+
+    Requests failed with transient errors are retried with `retry_policy`.
+    Articles which still can not be downloaded are skipped and left not
+    fetched, so they are fetched again next time. If `page_store` is
+    specified, downloaded pages are saved to it, and old pages are evicted
+    from it after articles are fetched.
+    """
+    from client import NO_RETRY_POLICY, REQUEST_ERRORS, SessionFactory
+    from pipeline import ArticlePipeline
+    session_factory = session_factory or SessionFactory()
+    retry_policy = retry_policy or NO_RETRY_POLICY
+
+    source, _ = await models.Source.get_or_create(
+        slug_name=module.source_slug_name
+    )
+
+    async with session_factory.create_session(limit_per_host) as session:
+        article_query = source.articles.filter(
+            Q(wikitext_paragraphs=None) & (
+                Q(source_url_ok=1) | Q(source_url_ok=None)
+            )
+        )
+        article_count = await article_query.count()
+        articles = iterate_article_rows(
+            article_query, models.ArticleFetchRow, chunk_size
+        )
+        failed_count = 0
+        with create_progressbar(article_count, show_progress) as bar:
+            if pipeline:
+                article_pipeline = ArticlePipeline(
+                    module, session, download_concurrency,
+                    parse_processes or parse_concurrency, write_batch_size,
+                    lambda _: bar.update(1),
+                    parse_in_processes=(parse_processes > 0),
+                    write_delay=write_delay, retry_policy=retry_policy,
+                    page_store=page_store
+                )
+                await article_pipeline.run(articles)
+                failed_count = article_pipeline.failed_count
+            else:
+                async with ArticleWriteBuffer(
+                    ARTICLE_CONTENT_FIELDS, write_batch_size, write_delay
+                ) as write_buffer:
+                    async for article in articles:
+                        try:
+                            await retry_policy.run(functools.partial(
+                                module.fetch_article, article, session,
+                                write_buffer, page_store
+                            ))
+                        except REQUEST_ERRORS:
+                            failed_count += 1
+                        bar.update(1)
+    if failed_count != 0:
+        click.echo(
+            f'{failed_count} articles were not fetched because of errors, '
+            'they will be fetched next time',
+            err=True
+        )
+    if page_store is not None:
+        await evict_stored_pages(page_store)
+
+
+async def evict_stored_pages(page_store: 'PageStore') -> int:
+    """
+    Evict old pages from page store and unlink articles from them.
+
+    Return number of evicted pages.
+    """
+    removed_hashes = list(await asyncio.get_running_loop().run_in_executor(
+        None, page_store.evict
+    ))
+    for index in range(0, len(removed_hashes), STORED_PAGE_QUERY_BATCH_SIZE):
+        await models.StoredPage.filter(content_hash__in=removed_hashes[
+            index:index + STORED_PAGE_QUERY_BATCH_SIZE
+        ]).delete()
+    return len(removed_hashes)
+
+
+async def reextract_async(
+    module: SourceModule, page_store: 'PageStore',
+    processes: Optional[int] = None, chunk_size: int = 500,
+    write_batch_size: int = 50, write_delay: float = 1.0,
+    show_progress: bool = True
+) -> int:
+    """
+    Extract article data again from pages stored in page store.
+
+    Network is not used. Pages are loaded and parsed in `processes` processes
+    (number of CPUs by default). Articles which pages are missing in page
+    store are not changed, return number of such articles.
+    """
+    from pipeline import init_parse_worker, reextract_article_in_worker
+    source, _ = await models.Source.get_or_create(
+        slug_name=module.source_slug_name
+    )
+
+    page_query = models.StoredPage.filter(article__source=source)
+    page_count = await page_query.count()
+    missing_count = 0
+    loop = asyncio.get_running_loop()
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=processes, initializer=init_parse_worker,
+        initargs=(module,)
+    ) as executor, create_progressbar(page_count, show_progress) as bar:
+        async with ArticleWriteBuffer(
+            ['author_name', 'wikitext_paragraphs'], write_batch_size,
+            write_delay
+        ) as write_buffer:
+            async for value_chunk in iterate_article_value_chunks(
+                page_query, (
+                    'article_id', 'content_hash', 'article__source_url',
+                    'article__author_name'
+                ), chunk_size
+            ):
+                contents = await asyncio.gather(*(
+                    loop.run_in_executor(
+                        executor, reextract_article_in_worker, page_store,
+                        content_hash, source_url
+                    )
+                    for _, content_hash, source_url, _ in value_chunk
+                ))
+                for values, content in zip(value_chunk, contents):
+                    bar.update(1)
+                    if content is None:
+                        missing_count += 1
+                        continue
+                    article_id, _, source_url, author_name = values
+                    article = models.ArticleFetchRow(
+                        article_id, source_url, True, author_name
+                    )
+                    content.apply(article)
+                    await write_buffer.add(article)
+    return missing_count
+
+
+async def verify_news_urls_async(
+    module: SourceModule, download_concurrency: int = 1,
+    limit_per_host: Optional[int] = None, chunk_size: int = 500,
+    write_batch_size: int = 1, write_delay: float = 1.0,
+    show_progress: bool = True,
+    session_factory: Optional['SessionFactory'] = None,
+    retry_policy: Optional['RetryPolicy'] = None
+) -> None:
+    """
+    Check URLs of all source articles again and save results.
+
+    Requests failed with transient errors are retried with `retry_policy`.
+    URLs which still can not be checked are left unchanged.
+    """
+    from client import NO_RETRY_POLICY, REQUEST_ERRORS, SessionFactory
+    session_factory = session_factory or SessionFactory()
+    retry_policy = retry_policy or NO_RETRY_POLICY
+
+    source, _ = await models.Source.get_or_create(
+        slug_name=module.source_slug_name
+    )
+
+    async with session_factory.create_session(limit_per_host) as session:
+        article_query = source.articles.all()
+        write_buffer = ArticleWriteBuffer(
+            ['source_url_ok'], write_batch_size, write_delay
+        )
+
+        failed_count = 0
+
+        async def check_url(article: models.ArticleFetchRow) -> None:
+            nonlocal failed_count
+            try:
+                await retry_policy.run(functools.partial(
+                    module.check_url, article, session, force=True,
+                    write_buffer=write_buffer
+                ))
+            except REQUEST_ERRORS:
+                failed_count += 1
+
+        with create_progressbar(
+            await article_query.count(), show_progress
+        ) as bar:
+            async with write_buffer:
+                async for value_chunk in iterate_article_value_chunks(
+                    article_query, models.ArticleFetchRow.FIELD_NAMES,
+                    chunk_size
+                ):
+                    articles = [
+                        models.ArticleFetchRow(*values)
+                        for values in value_chunk
+                    ]
+                    async for _ in map_ordered(
+                        check_url, articles, download_concurrency
+                    ):
+                        bar.update(1)
+    if failed_count != 0:
+        click.echo(
+            f'{failed_count} URLs were not checked because of errors',
+            err=True
+        )
+
+
+async def get_tag_titles_by_article_id(
+    article_ids: List[int], tag_titles_by_id: Dict[int, str]
+) -> Dict[int, List[str]]:
+    """
+    Load tag titles for articles with IDs from list.
+
+    Titles of tags are cached in `tag_titles_by_id` dictionary, so only
+    new tags are loaded.
+    """
+    article_tag_ids = await models.ArticleTag.filter(
+        article_id__in=article_ids
+    ).values_list('article_id', 'tag_id')
+    new_tag_ids = list({
+        tag_id for _, tag_id in article_tag_ids
+        if tag_id not in tag_titles_by_id
+    })
+    for index in range(0, len(new_tag_ids), TAG_QUERY_BATCH_SIZE):
+        tag_titles_by_id.update(await models.Tag.filter(
+            tag_id__in=new_tag_ids[index:index + TAG_QUERY_BATCH_SIZE]
+        ).values_list('tag_id', 'title'))
+    tag_titles_by_article_id: Dict[int, List[str]] = {}
+    for article_id, tag_id in article_tag_ids:
+        tag_titles_by_article_id.setdefault(article_id, []).append(
+            tag_titles_by_id[tag_id]
+        )
+    return tag_titles_by_article_id
+
+
+async def iterate_article_rows(
+    query: 'QuerySet[models.Article]', row_class: Type[RowT], chunk_size: int
+) -> AsyncIterator[RowT]:
+    """
+    Iterate over articles from query loaded as `row_class` objects.
+
+    Only fields from `FIELD_NAMES` of `row_class` are loaded, articles are
+    loaded from database in chunks of `chunk_size` articles.
+    """
+    async for value_chunk in iterate_article_value_chunks(
+        query, row_class.FIELD_NAMES, chunk_size
+    ):
+        for values in value_chunk:
+            yield row_class(*values)
+
+
+async def save_generated_page_hashes(
+    content_hashes_by_article_id: Dict[int, str]
+) -> None:
+    async with tortoise.transactions.in_transaction():
+        await models.GeneratedPage.filter(
+            article_id__in=list(content_hashes_by_article_id)
+        ).delete()
+        await models.GeneratedPage.bulk_create([
+            models.GeneratedPage(article_id=article_id, content_hash=value)
+            for article_id, value in content_hashes_by_article_id.items()
+        ])
+
+
+async def generate_wiki_pages_async(
+    module: SourceModule, bot_name: str,
+    output_directory_path: pathlib.Path, output_file: TextIO,
+    chunk_size: int = 500, force: bool = False, show_progress: bool = True
+) -> int:
+    """
+    Generate wiki-pages, write them to files and write list of pages.
+
+    Articles are processed in chunks, every page is written to file
+    as soon as it is rendered. Page is not rendered again if its file exists
+    and hash of data used to render it is not changed since last time,
+    unless `force` is `True`. Return number of listed pages.
+    """
+    source, _ = await models.Source.get_or_create(
+        slug_name=module.source_slug_name
+    )
+
+    article_query = source.articles.filter(
+        ~Q(wikitext_paragraphs=None) & Q(uploaded=False)
+    )
+    article_count = await article_query.count()
+    field_names = (
+        models.ArticlePageRow.FIELD_NAMES_WITH_MISC_DATA
+        if module.wiki_page_uses_misc_data
+        else models.ArticlePageRow.FIELD_NAMES
+    )
+    page_count = 0
+    skipped_page_count = 0
+    tag_titles_by_id: Dict[int, str] = {}
+
+    with create_progressbar(
+        article_count, show_progress
+    ) as bar, JSONObjectWriter(output_file) as pages_writer:
+        async for value_chunk in iterate_article_value_chunks(
+            article_query, field_names, chunk_size
+        ):
+            articles = [
+                models.ArticlePageRow(*values) for values in value_chunk
+            ]
+            article_ids = [article.article_id for article in articles]
+            tag_titles_by_article_id = await get_tag_titles_by_article_id(
+                article_ids, tag_titles_by_id
+            )
+            old_content_hashes_by_article_id: Dict[int, str] = dict(
+                await models.GeneratedPage.filter(
+                    article_id__in=article_ids
+                ).values_list('article_id', 'content_hash')
+            )
+            content_hashes_by_article_id: Dict[int, str] = {}
+            for article in articles:
+                bar.update(1)
+                tag_titles = tag_titles_by_article_id.get(
+                    article.article_id, []
+                )
+                article_name = re.sub(
+                    r'[^0-9a-zA-Z\-_]+', '', article.slug_name
+                )
+                page_file_path = output_directory_path.joinpath(
+                    f'{article_name}.txt'
+                )
+                content_hash = module.get_wiki_page_hash(
+                    article, bot_name, tag_titles
+                )
+                if (
+                    (not force) and page_file_path.exists()
+                    and (
+                        old_content_hashes_by_article_id.get(
+                            article.article_id
+                        ) == content_hash
+                    )
+                ):
+                    skipped_page_count += 1
+                else:
+                    wiki_page_text = module.render_wiki_page_text(
+                        article, bot_name, tag_titles
+                    )
+                    if wiki_page_text is None:
+                        continue
+                    with open(page_file_path, mode='wt') as page_file:
+                        page_file.write(wiki_page_text)
+                    content_hashes_by_article_id[article.article_id] = (
+                        content_hash
+                    )
+                pages_writer.write_item(article.slug_name, {
+                    'path': str(page_file_path),
+                    'title': article.title
+                })
+                page_count += 1
+            if len(content_hashes_by_article_id) != 0:
+                await save_generated_page_hashes(content_hashes_by_article_id)
+
+    if skipped_page_count != 0:
+        click.echo(
+            f'{skipped_page_count} pages are not changed and were not '
+            'written again',
+            err=True
+        )
+    return page_count
+
+
+async def mark_uploaded_pages_async(
+    module: SourceModule, slug_names: Iterable[str]
+) -> None:
+    source, _ = await models.Source.get_or_create(
+        slug_name=module.source_slug_name
+    )
+
+    await source.articles.filter(
+        slug_name__in=slug_names
+    ).update(
+        uploaded=True
+    )
+
+
+def get_stored_size(value: Any) -> int:
+    """Get size in bytes of column value as stored in DB."""
+    if value is None:
+        return 0
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    return len(value)
+
+
+async def compact_db_async(
+    module: SourceModule, chunk_size: int = 500, vacuum: bool = False,
+    show_progress: bool = True
+) -> Tuple[int, int]:
+    """
+    Rewrite JSON fields of source articles in compact form.
+
+    `misc_data` is trimmed by source module, and `wikitext_paragraphs` are
+    encoded with current compression of paragraphs codec. Only changed
+    articles are written, every chunk in one transaction. If `vacuum` is
+    `True`, DB is vacuumed to return free space to file system. Return
+    total size of field values in bytes before and after.
+    """
+    source, _ = await models.Source.get_or_create(
+        slug_name=module.source_slug_name
+    )
+    field_names = ['wikitext_paragraphs', 'misc_data']
+    fields_map = models.Article._meta.fields_map
+    connection = tortoise.Tortoise.get_connection('default')
+    update_sql = get_update_sql(field_names, connection.capabilities.dialect)
+
+    old_size = 0
+    new_size = 0
+    with create_progressbar(
+        await source.articles.all().count(), show_progress
+    ) as bar:
+        async for rows in iterate_raw_article_chunks(
+            source.slug_name, field_names, chunk_size
+        ):
+            updates: List[List[object]] = []
+            for row in rows:
+                values = {
+                    field_name: fields_map[field_name].to_python_value(
+                        row[field_name]
+                    )
+                    for field_name in field_names
+                }
+                values['misc_data'] = module.compact_misc_data(
+                    values['misc_data']
+                )
+                db_values = get_db_values(field_names, values)
+                old_size += sum(
+                    get_stored_size(row[field_name])
+                    for field_name in field_names
+                )
+                new_size += sum(map(get_stored_size, db_values))
+                old_values = [row[field_name] for field_name in field_names]
+                if db_values != old_values:
+                    updates.append(db_values + [row['article_id']])
+            if len(updates) != 0:
+                async with tortoise.transactions.in_transaction() as client:
+                    await client.execute_many(update_sql, updates)
+            bar.update(len(rows))
+    if vacuum:
+        await connection.execute_script('VACUUM')
+    return old_size, new_size
+
+
+async def run_source_async(
+    module: SourceModule, output_directory_path: pathlib.Path,
+    bot_name: str, last_page: int, early_stop: bool,
+    download_concurrency: int,
+    session_factory: Optional['SessionFactory'] = None,
+    retry_policy: Optional['RetryPolicy'] = None,
+    page_store: Optional['PageStore'] = None
+) -> Dict[str, float]:
+    """
+    Fetch news and articles and generate wiki-pages for one source.
+
+    Pages are written to directory named after source, list of pages is
+    written to JSON file named after source. Return time of every stage.
+    """
+    times: Dict[str, float] = {}
+
+    start_time = time.perf_counter()
+    await fetch_news_async(
+        module, 1, last_page, early_stop=early_stop, show_progress=False,
+        session_factory=session_factory, retry_policy=retry_policy
+    )
+    times['fetch-news'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    await fetch_news_pages_async(
+        module, pipeline=True, download_concurrency=download_concurrency,
+        parse_concurrency=2, write_batch_size=50, show_progress=False,
+        session_factory=session_factory, retry_policy=retry_policy,
+        page_store=page_store
+    )
+    times['fetch-news-pages'] = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    pages_directory_path = output_directory_path.joinpath(
+        module.source_slug_name
+    )
+    pages_directory_path.mkdir(exist_ok=True)
+    with open(
+        output_directory_path.joinpath(f'{module.source_slug_name}.json'),
+        mode='wt'
+    ) as output_file:
+        await generate_wiki_pages_async(
+            module, bot_name, pages_directory_path, output_file,
+            show_progress=False
+        )
+    times['generate-wiki-pages'] = time.perf_counter() - start_time
+
+    return times
+
+
+async def run_all_async(
+    modules: List[SourceModule], output_directory_path: pathlib.Path,
+    bot_name: str, last_page: int = 1, early_stop: bool = False,
+    source_concurrency: int = 1, download_concurrency: int = 8,
+    session_factory: Optional['SessionFactory'] = None,
+    retry_policy: Optional['RetryPolicy'] = None,
+    page_store: Optional['PageStore'] = None
+) -> int:
+    """
+    Run all stages for all sources concurrently, report time for every one.
+
+    Error in one source does not stop other sources. Return number of
+    sources which failed. Sources share sessions configuration and rate
+    limiter of `session_factory`, so sources on the same host share its
+    rate.
+    """
+    async def run_source(
+        module: SourceModule
+    ) -> Tuple[SourceModule, Optional[Dict[str, float]]]:
+        try:
+            return module, await run_source_async(
+                module, output_directory_path, bot_name, last_page,
+                early_stop, download_concurrency, session_factory,
+                retry_policy, page_store
+            )
+        except Exception as exc:  # noqa: B902
+            click.echo(f'{module.source_slug_name}: error: {exc!r}', err=True)
+            return module, None
+
+    failed_count = 0
+    async for module, times in map_ordered(
+        run_source, modules, source_concurrency
+    ):
+        if times is None:
+            failed_count += 1
+            continue
+        times_str = ', '.join(
+            f'{stage} {stage_time:.3f} s'
+            for stage, stage_time in times.items()
+        )
+        click.echo(
+            f'{module.source_slug_name}: {times_str}, '
+            f'total {sum(times.values()):.3f} s',
+            err=True
+        )
+    return failed_count
@@ -1,19 +1,60 @@
-from typing import Awaitable, Callable
+import asyncio
+import datetime
+import email.utils
+import functools
+import json
+import os
+import pathlib
+import random
+import subprocess
+import sys
+import time
+from typing import (Any, AsyncIterator, Awaitable, Callable, Container, Dict,
+                    Iterable, List, Optional, Set, Tuple)
 
 import aiohttp
+import aiohttp.test_utils
+import click
 import pytest
-import pytest_aiohttp
 import pytest_asyncio
+import tortoise.backends.sqlite.client
 import tortoise.contrib.test
 
 import models
 import rss
-from db import init_db
-from news_fetcher import fetch_news_async
+from benchmark import (extract_paragraphs, html_to_wikitext_recursive,
+                       load_corpus)
+from client import (HostRateLimiter, HTTPStatusError, RetryPolicy,
+                    SessionConfig, SessionFactory, parse_retry_after)
+from concurrency import map_ordered
+from db import SCHEMA_VERSION, init_db, migrate_db
+from json_codec import PARAGRAPHS_CODEC
+from module import ArticleContent, SourceModule
+from news_fetcher import load_manifest
+from page_store import PageStore
+from parsers import PARSER_BACKEND_CREATORS, get_parser_backend
+from stages import (compact_db_async, evict_stored_pages, fetch_news_async,
+                    fetch_news_pages_async, generate_wiki_pages_async,
+                    get_tag_titles_by_article_id, reextract_async,
+                    run_all_async, verify_news_urls_async)
+from wikitext import html_to_wikitext
+from write_buffer import ArticleWriteBuffer
+
+MOCK_PAGES = {
+    '/news/million-bucks': '''
+        <html><body><div class="article__block">
+        <div class="article__text">Любовница <b>президента</b> пожертвовала
+        <a href="/news/dollar">миллион</a>.<br>Семья опровергла.</div>
+        <div class="article__text">Подробности <strong>позже</strong>.
+        <script>track();</script></div>
+        </div></body></html>
+    ''',
+}
 
 
 class MockApp:
     base_url: str = 'http://localhost'
+    error_paths: Container[str] = frozenset()
 
     async def get_mock_rss(
         self, request: aiohttp.web.Request
@@ -61,28 +102,65 @@ class MockApp:
         ) -> aiohttp.web.Response:
             return await self.get_mock_rss(request)
 
+        async def get_mock_page(
+            request: aiohttp.web.Request
+        ) -> aiohttp.web.Response:
+            if request.path in self.error_paths:
+                raise aiohttp.web.HTTPInternalServerError()
+            if request.path not in MOCK_PAGES:
+                raise aiohttp.web.HTTPNotFound()
+            return aiohttp.web.Response(
+                text=MOCK_PAGES[request.path], content_type='text/html'
+            )
+
         app = aiohttp.web.Application()
         app.router.add_route(
-            'GET', '/rss/rss.xml', get_mock_rss
+            'GET', '/rss/{name}', get_mock_rss
         )
-        # for page_url, page_content in pages.items():
-        #     app.router.add_route(
-        #         'GET', page_url, return_static_route(page_content)
-        #     )
+        app.router.add_route('*', '/news/{name}', get_mock_page)
         return app
 
 
 @pytest_asyncio.fixture(autouse=True)
-async def fixture_db():
-    await init_db('sqlite://:memory:')
+async def fixture_db() -> AsyncIterator[None]:
+    await init_db('sqlite://:memory:', check_version=False)
+    await migrate_db()
     yield
     await tortoise.Tortoise._drop_databases()
 
 
+@pytest.mark.asyncio
+async def test_init_db(tmp_path: pathlib.Path) -> None:
+    db_url = f'sqlite://{tmp_path}/test.sqlite3'
+
+    async def reconnect() -> None:
+        await tortoise.connection.connections.close_all()
+        await init_db(db_url)
+
+    with pytest.raises(ValueError, match='not initialized'):
+        await reconnect()
+    assert await migrate_db() is None
+    await reconnect()
+
+    await models.SchemaVersion.all().update(version=SCHEMA_VERSION + 1)
+    with pytest.raises(ValueError, match='run `init-db`'):
+        await reconnect()
+    assert await migrate_db() == SCHEMA_VERSION + 1
+    await reconnect()
+    assert await models.SchemaVersion.all().count() == 1
+
+    # Nothing is changed if schema version is current
+    schema_version = await models.SchemaVersion.get()
+    assert await migrate_db() == SCHEMA_VERSION
+    assert (await models.SchemaVersion.get()).schema_version_id == (
+        schema_version.schema_version_id
+    )
+
+
 @pytest.mark.asyncio
 async def test_rss_fetch_news(
     aiohttp_server: Callable[
-        [aiohttp.web.Application], Awaitable[pytest_aiohttp.plugin.TestServer]
+        [aiohttp.web.Application], Awaitable[aiohttp.test_utils.TestServer]
     ]
 ) -> None:
     app = MockApp()
@@ -109,8 +187,1143 @@ async def test_rss_fetch_news(
     )
     assert article1.title == 'Любовь на миллион'
     assert article1.date.isoformat() == '2022-07-03T06:11:11+00:00'
+    assert sorted(article1.misc_data) == ['id', 'published', 'summary']
     assert len(article1.tags) == 1
     assert article1.tags[0].title == 'Лента новостей'
 
 
+class ConditionalMockApp(MockApp):
+    etag: Optional[str] = '"v1"'
+    rss_request_count: int = 0
+
+    async def get_mock_rss(
+        self, request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        self.rss_request_count += 1
+        if (
+            (self.etag is not None)
+            and (request.headers.get('If-None-Match') == self.etag)
+        ):
+            return aiohttp.web.Response(status=304)
+        response = await super().get_mock_rss(request)
+        if self.etag is not None:
+            response.headers['ETag'] = self.etag
+        return response
+
+
+@pytest.mark.asyncio
+async def test_rss_fetch_news_conditional(
+    aiohttp_server: Callable[
+        [aiohttp.web.Application], Awaitable[aiohttp.test_utils.TestServer]
+    ]
+) -> None:
+    app = ConditionalMockApp()
+
+    server = await aiohttp_server(app.get_aiohttp_app())
+
+    app.base_url = f'http://{server.host}:{server.port}'
+
+    with open('data/test/rss.json', mode='rt') as config_file:
+        module = rss.RSSModule(
+            config_file, app.base_url + '/rss/rss.xml', 'test'
+        )
+
+    await fetch_news_async(module, 1, 1)
+    assert await models.Article.all().count() == 2
+    feed_cache = await models.FeedCache.get(url=module.rss_url)
+    assert feed_cache.etag == '"v1"'
+
+    # Server returns 304
+    await models.Article.all().delete()
+    await fetch_news_async(module, 1, 1)
+    assert app.rss_request_count == 2
+    assert await models.Article.all().count() == 0
+
+    # Server ignores headers, but feed is not changed
+    app.etag = None
+    await fetch_news_async(module, 1, 1)
+    assert app.rss_request_count == 3
+    assert await models.Article.all().count() == 0
+
+    # Feed is changed
+    app.base_url = f'http://localhost:{server.port}'
+    await fetch_news_async(module, 1, 1)
+    assert await models.Article.all().count() == 2
+    feed_cache = await models.FeedCache.get(url=module.rss_url)
+    assert feed_cache.etag is None
+
+
+@pytest.mark.asyncio
+async def test_rss_fetch_news_without_published_date(
+    aiohttp_server: Callable[
+        [aiohttp.web.Application], Awaitable[aiohttp.test_utils.TestServer]
+    ],
+    tmp_path: pathlib.Path
+) -> None:
+    async def get_atom(request: aiohttp.web.Request) -> aiohttp.web.Response:
+        return aiohttp.web.Response(text='''<?xml version="1.0"?>
+            <feed xmlns="http://www.w3.org/2005/Atom">
+            <title>Тест-новости</title>
+            <entry>
+            <title>Любовь на миллион</title>
+            <link href="http://localhost/news/million-bucks"/>
+            <id>http://localhost/news/million-bucks</id>
+            <updated>2022-07-03T09:11:11+03:00</updated>
+            </entry>
+            <entry>
+            <title>Без даты</title>
+            <link href="http://localhost/news/no-date"/>
+            <id>http://localhost/news/no-date</id>
+            </entry>
+            </feed>
+        ''', content_type='application/atom+xml')
+
+    app = aiohttp.web.Application()
+    app.router.add_route('GET', '/atom.xml', get_atom)
+    server = await aiohttp_server(app)
+
+    with open('data/test/rss.json', mode='rt') as config_file:
+        module = rss.RSSModule(
+            config_file, f'http://{server.host}:{server.port}/atom.xml',
+            'test'
+        )
+
+    # Update date is used, entry without dates is skipped
+    await fetch_news_async(module, 1, 1)
+    articles = await models.Article.all()
+    assert [article.title for article in articles] == ['Любовь на миллион']
+    assert articles[0].date.isoformat() == '2022-07-03T06:11:11+00:00'
+    assert await models.FeedCache.filter(url=module.rss_url).exists()
+
+    await models.Article.all().update(wikitext_paragraphs=['Текст.'])
+    with open(tmp_path / 'pages.json', mode='wt') as output_file:
+        page_count = await generate_wiki_pages_async(
+            module, 'TestBot', tmp_path, output_file
+        )
+    assert page_count == 1
+    with open(tmp_path / 'pages.json', mode='rt') as output_file:
+        pages_data = json.load(output_file)
+    page_path = pages_data['http://localhost/news/million-bucks']['path']
+    with open(page_path, mode='rt') as page_file:
+        assert page_file.read().startswith('{{дата|2022-07-03}}')
+
+
+class PaginatedMockApp(MockApp):
+    requested_paths: List[str]
+
+    def __init__(self) -> None:
+        self.requested_paths = []
+
+    async def get_mock_rss(
+        self, request: aiohttp.web.Request
+    ) -> aiohttp.web.Response:
+        self.requested_paths.append(request.path_qs)
+        response = await super().get_mock_rss(request)
+        page = request.query.get('page')
+        if (page is not None) and (response.text is not None):
+            response.text = response.text.replace(
+                'million-bucks', f'million-bucks-{page}'
+            )
+        return response
+
+
+@pytest.mark.asyncio
+async def test_rss_fetch_news_paginated(
+    aiohttp_server: Callable[
+        [aiohttp.web.Application], Awaitable[aiohttp.test_utils.TestServer]
+    ],
+    tmp_path: pathlib.Path
+) -> None:
+    app = PaginatedMockApp()
+
+    server = await aiohttp_server(app.get_aiohttp_app())
+
+    app.base_url = f'http://{server.host}:{server.port}'
+
+    with open('data/test/rss.json', mode='rt') as config_file:
+        config = json.load(config_file)
+    config['extra_rss_urls'] = [app.base_url + '/rss/en.xml']
+    config['page_url_template'] = '{url}?page={page}'
+    with open(tmp_path / 'rss.json', mode='w+t') as config_file:
+        json.dump(config, config_file)
+        config_file.seek(0)
+        module = rss.RSSModule(
+            config_file, app.base_url + '/rss/rss.xml', 'test'
+        )
+
+    # Same entries of two feeds are de-duplicated
+    source = await models.Source.create(slug_name='test')
+    async with aiohttp.ClientSession() as session:
+        articles, _ = await module.fetch_news(session, 1, source)
+    assert len(list(articles)) == 2
+    module.feed_cache_updates.clear()
+
+    app.requested_paths.clear()
+    await fetch_news_async(module, 1, 2, concurrency=2)
+    assert sorted(app.requested_paths) == [
+        '/rss/en.xml', '/rss/en.xml?page=2', '/rss/rss.xml',
+        '/rss/rss.xml?page=2'
+    ]
+    articles = await models.Article.all().order_by('article_id')
+    assert [article.slug_name for article in articles] == [
+        f'{app.base_url}/news/million-bucks-2',
+        f'{app.base_url}/news/railroad-station-suitcases',
+        f'{app.base_url}/news/million-bucks'
+    ]
+    assert await models.FeedCache.all().count() == 4
+    assert len(module.feed_cache_updates) == 0
+
+    # Feeds without page URL template have one page
+    module.page_url_template = None
+    assert module.get_feed_urls(2) == []
+
+    with pytest.raises(ValueError, match='page_url_template'):
+        config['page_url_template'] = '{url}?page={number}'
+        with open(tmp_path / 'rss.json', mode='w+t') as config_file:
+            json.dump(config, config_file)
+            config_file.seek(0)
+            rss.RSSModule(config_file, app.base_url + '/rss/rss.xml', 'test')
+
+
+@pytest.mark.asyncio
+async def test_rss_fetch_news_streaming(
+    aiohttp_server: Callable[
+        [aiohttp.web.Application], Awaitable[aiohttp.test_utils.TestServer]
+    ],
+    tmp_path: pathlib.Path
+) -> None:
+    app = ConditionalMockApp()
+
+    server = await aiohttp_server(app.get_aiohttp_app())
+
+    app.base_url = f'http://{server.host}:{server.port}'
+
+    with open('data/test/rss.json', mode='rt') as config_file:
+        config = json.load(config_file)
+    config['stream_batch_size'] = 1
+    with open(tmp_path / 'rss.json', mode='w+t') as config_file:
+        json.dump(config, config_file)
+        config_file.seek(0)
+        module = rss.RSSModule(
+            config_file, app.base_url + '/rss/rss.xml', 'test'
+        )
+    assert module.streams_news
+
+    # Entries are parsed from feed split into small chunks
+    response = await MockApp().get_mock_rss(None)  # type: ignore
+    assert response.text is not None
+    data = response.text.encode('utf-8')
+    stream = rss.FeedEntryStream()
+    entries = []
+    for index in range(0, len(data), 7):
+        entries += stream.feed(data[index:index + 7])
+    entries += stream.close()
+    assert [entry.title for entry in entries] == [
+        'Любовь на миллион', 'Чемоданный переполох'
+    ]
+    assert len(stream.open_elements) == 0
+
+    await fetch_news_async(module, 1, 1)
+    articles = await models.Article.all().order_by(
+        'article_id'
+    ).prefetch_related('tags')
+    assert [article.title for article in articles] == [
+        'Любовь на миллион', 'Чемоданный переполох'
+    ]
+    assert articles[0].date.isoformat() == '2022-07-03T06:11:11+00:00'
+    assert [tag.title for tag in articles[0].tags] == ['Лента новостей']
+    feed_cache = await models.FeedCache.get(url=module.rss_url)
+    assert feed_cache.etag == '"v1"'
+
+    # Server returns 304
+    await models.Article.all().delete()
+    await fetch_news_async(module, 1, 1)
+    assert app.rss_request_count == 2
+    assert await models.Article.all().count() == 0
+
+    with pytest.raises(ValueError, match='Invalid feed XML'):
+        rss.FeedEntryStream().feed(b'<rss><channel></rss>')
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    ('pipeline', 'parse_processes'), [(False, 0), (True, 0), (True, 2)]
+)
+async def test_rss_fetch_news_pages(
+    aiohttp_server: Callable[
+        [aiohttp.web.Application], Awaitable[aiohttp.test_utils.TestServer]
+    ],
+    pipeline: bool, parse_processes: int
+) -> None:
+    app = MockApp()
+
+    server = await aiohttp_server(app.get_aiohttp_app())
+
+    app.base_url = f'http://{server.host}:{server.port}'
+
+    with open('data/test/rss.json', mode='rt') as config_file:
+        module = rss.RSSModule(
+            config_file, app.base_url + '/rss/rss.xml', 'test'
+        )
+
+    await fetch_news_async(module, 1, 1)
+    author_names = await models.Article.all().order_by(
+        'article_id'
+    ).values_list('author_name', flat=True)
+
+    async def fetch_news_pages() -> None:
+        await fetch_news_pages_async(
+            module, pipeline=pipeline, download_concurrency=2,
+            parse_concurrency=2, write_batch_size=1,
+            parse_processes=parse_processes, chunk_size=1,
+            retry_policy=RetryPolicy(attempts=2, base_delay=0.01)
+        )
+
+    # Article is skipped if server error is not fixed after retry
+    app.error_paths = {'/news/million-bucks'}
+    await fetch_news_pages()
+    articles = await models.Article.all().order_by('article_id')
+    assert articles[0].source_url_ok is None
+    assert articles[0].wikitext_paragraphs is None
+    assert articles[1].source_url_ok is False
+
+    app.error_paths = frozenset()
+    await fetch_news_pages()
+    articles = await models.Article.all().order_by('article_id')
+    assert [article.author_name for article in articles] == author_names
+    assert articles[0].source_url_ok is True
+    assert articles[0].wikitext_paragraphs == [
+        f"Любовница '''президента''' пожертвовала\n        "
+        f"[{app.base_url}/news/dollar миллион].<br />Семья опровергла.",
+        "Подробности '''позже'''.\n        ",
+    ]
+    assert articles[1].source_url_ok is False
+    assert articles[1].wikitext_paragraphs is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('pipeline', [False, True])
+async def test_page_store_reextract(
+    aiohttp_server: Callable[
+        [aiohttp.web.Application], Awaitable[aiohttp.test_utils.TestServer]
+    ],
+    tmp_path: pathlib.Path, pipeline: bool
+) -> None:
+    app = MockApp()
+    server = await aiohttp_server(app.get_aiohttp_app())
+    app.base_url = f'http://{server.host}:{server.port}'
+
+    with open('data/test/rss.json', mode='rt') as config_file:
+        module = rss.RSSModule(
+            config_file, app.base_url + '/rss/rss.xml', 'test'
+        )
+    page_store = PageStore(tmp_path)
+
+    await fetch_news_async(module, 1, 1)
+    await fetch_news_pages_async(
+        module, pipeline=pipeline, write_batch_size=1, page_store=page_store
+    )
+    stored_pages = await models.StoredPage.all()
+    assert len(stored_pages) == 1
+    html = page_store.load(stored_pages[0].content_hash)
+    assert html is not None
+    assert 'Любовница' in html
+
+    # Pages are extracted again without network
+    await server.close()
+    module.disable_bold_font = True
+    assert await reextract_async(
+        module, page_store, processes=1, show_progress=False
+    ) == 0
+    articles = await models.Article.all().order_by('article_id')
+    assert articles[0].wikitext_paragraphs == [
+        f"Любовница президента пожертвовала\n        "
+        f"[{app.base_url}/news/dollar миллион].<br />Семья опровергла.",
+        "Подробности позже.\n        ",
+    ]
+    assert articles[1].wikitext_paragraphs is None
+
+    page_store.max_size = 0
+    assert await evict_stored_pages(page_store) == 1
+    assert page_store.load(stored_pages[0].content_hash) is None
+    assert await models.StoredPage.all().count() == 0
+
+
+@pytest.mark.asyncio
+async def test_run_all(
+    aiohttp_server: Callable[
+        [aiohttp.web.Application], Awaitable[aiohttp.test_utils.TestServer]
+    ],
+    tmp_path: pathlib.Path
+) -> None:
+    app = MockApp()
+
+    server = await aiohttp_server(app.get_aiohttp_app())
+
+    app.base_url = f'http://{server.host}:{server.port}'
+
+    manifest = [
+        {
+            'source_module': 'rss', 'data_file': 'data/test/rss.json',
+            'source_path': f'{app.base_url}/rss/rss.xml',
+            'source_name': source_name, 'parser_backend': 'html.parser'
+        }
+        for source_name in ('first', 'second', 'broken')
+    ]
+    # Connection to port 1 is refused
+    manifest[2]['source_path'] = 'http://127.0.0.1:1/rss/rss.xml'
+    with open(tmp_path.joinpath('manifest.json'), mode='w+t') as file:
+        json.dump(manifest + manifest[:1], file)
+        file.seek(0)
+        with pytest.raises(click.ClickException, match='duplicate source'):
+            load_manifest(file)
+        file.seek(0)
+        file.truncate()
+        json.dump(manifest, file)
+        file.seek(0)
+        modules = load_manifest(file)
+
+    failed_count = await run_all_async(
+        modules, tmp_path, 'TestBot', source_concurrency=3
+    )
+
+    assert failed_count == 1
+    for source_name in ('first', 'second'):
+        assert await models.Article.filter(
+            source_id=source_name
+        ).count() == 2
+        with open(tmp_path.joinpath(f'{source_name}.json')) as file:
+            pages_data = json.load(file)
+        assert len(pages_data) == 1
+        assert pathlib.Path(
+            next(iter(pages_data.values()))['path']
+        ).parent == tmp_path.joinpath(source_name)
+
+
+@pytest.mark.asyncio
+async def test_rss_verify_news_urls(
+    aiohttp_server: Callable[
+        [aiohttp.web.Application], Awaitable[aiohttp.test_utils.TestServer]
+    ]
+) -> None:
+    app = MockApp()
+
+    server = await aiohttp_server(app.get_aiohttp_app())
+
+    app.base_url = f'http://{server.host}:{server.port}'
+
+    with open('data/test/rss.json', mode='rt') as config_file:
+        module = rss.RSSModule(
+            config_file, app.base_url + '/rss/rss.xml', 'test'
+        )
+
+    await fetch_news_async(module, 1, 1)
+    await models.Article.all().update(source_url_ok=True)
+    await verify_news_urls_async(
+        module, download_concurrency=2, chunk_size=1
+    )
+
+    articles = await models.Article.all().order_by('article_id')
+    assert articles[0].source_url_ok is True
+    assert articles[1].source_url_ok is False
+    assert articles[0].wikitext_paragraphs is None
+
+    # URLs are left unchanged after server errors and timeouts
+    async def handle_connection(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        await asyncio.sleep(1)
+        writer.close()
+
+    slow_server = await asyncio.start_server(
+        handle_connection, '127.0.0.1', 0
+    )
+    port = slow_server.sockets[0].getsockname()[1]
+    await models.Article.filter(article_id=articles[1].article_id).update(
+        source_url=f'http://127.0.0.1:{port}/news', source_url_ok=None
+    )
+    app.error_paths = {'/news/million-bucks'}
+    async with slow_server:
+        await verify_news_urls_async(
+            module, show_progress=False,
+            session_factory=SessionFactory(SessionConfig(total_timeout=0.1)),
+            retry_policy=RetryPolicy(attempts=2, base_delay=0.01)
+        )
+    articles = await models.Article.all().order_by('article_id')
+    assert articles[0].source_url_ok is True
+    assert articles[1].source_url_ok is None
+
+
+@pytest.mark.asyncio
+async def test_rss_generate_wiki_pages(
+    monkeypatch: pytest.MonkeyPatch, tmp_path: pathlib.Path
+) -> None:
+    with open('data/test/rss.json', mode='rt') as config_file:
+        module = rss.RSSModule(config_file, 'http://localhost/rss', 'test')
+    source = await models.Source.create(slug_name='test')
+    tag1 = await models.Tag.create(title='Тег 1')
+    tag2 = await models.Tag.create(title='Тег 2')
+
+    query_count = 0
+    execute_query = tortoise.backends.sqlite.client.SqliteClient.execute_query
+
+    async def counting_execute_query(*args: Any, **kwargs: Any) -> Any:
+        nonlocal query_count
+        query_count += 1
+        return await execute_query(*args, **kwargs)
+
+    monkeypatch.setattr(
+        tortoise.backends.sqlite.client.SqliteClient, 'execute_query',
+        counting_execute_query
+    )
+
+    query_counts: List[int] = []
+    for article_count in (1, 5):
+        await models.Article.all().update(uploaded=True)
+        for index in range(article_count):
+            article = await models.Article.create(
+                source=source, slug_name=f'news-{article_count}-{index}',
+                title=f'Новость {index}', source_url='http://localhost/news',
+                date='2022-07-03T06:11:11+00:00', misc_data={},
+                wikitext_paragraphs=['Текст.']
+            )
+            await models.ArticleTag.create(article=article, tag=tag2)
+            await models.ArticleTag.create(article=article, tag=tag1)
+        query_count = 0
+        with open(tmp_path / 'pages.json', mode='wt') as output_file:
+            page_count = await generate_wiki_pages_async(
+                module, 'TestBot', tmp_path, output_file
+            )
+        query_counts.append(query_count)
+        assert page_count == article_count
+
+    assert 0 < query_counts[0] == query_counts[1]
+
+    with open(tmp_path / 'pages.json', mode='rt') as output_file:
+        pages_data = json.load(output_file)
+    assert list(pages_data) == [f'news-5-{index}' for index in range(5)]
+    assert pages_data['news-5-0']['title'] == 'Новость 0'
+    with open(pages_data['news-5-0']['path'], mode='rt') as page_file:
+        wiki_page_text = page_file.read()
+    assert wiki_page_text.endswith('{{Категории|Тег 1|Тег 2}}')
+
+    with open(tmp_path / 'pages_chunked.json', mode='wt') as output_file:
+        await generate_wiki_pages_async(
+            module, 'TestBot', tmp_path, output_file, chunk_size=2
+        )
+    with open(tmp_path / 'pages_chunked.json', mode='rt') as output_file:
+        assert json.load(output_file) == pages_data
+
+
+@pytest.mark.asyncio
+async def test_get_tag_titles_by_article_id() -> None:
+    # Articles of sources are interleaved, tags of other source are not
+    # loaded
+    sources = [
+        await models.Source.create(slug_name=f'test{index}')
+        for index in range(2)
+    ]
+    article_ids: List[List[int]] = [[], []]
+    for index in range(4):
+        source_index = index % 2
+        tag = await models.Tag.create(title=f'Тег {index}')
+        article = await models.Article.create(
+            source=sources[source_index], slug_name=f'news-{index}',
+            title=f'Новость {index}', source_url='http://localhost/news',
+            date='2022-07-03T06:11:11+00:00', misc_data={}
+        )
+        await models.ArticleTag.create(article=article, tag=tag)
+        article_ids[source_index].append(article.article_id)
+
+    tag_titles_by_id: Dict[int, str] = {}
+    tag_titles_by_article_id = await get_tag_titles_by_article_id(
+        article_ids[0], tag_titles_by_id
+    )
+    assert tag_titles_by_article_id == {
+        article_ids[0][0]: ['Тег 0'], article_ids[0][1]: ['Тег 2']
+    }
+    assert sorted(tag_titles_by_id.values()) == ['Тег 0', 'Тег 2']
+
+
+@pytest.mark.asyncio
+async def test_compact_db() -> None:
+    with open('data/test/rss.json', mode='rt') as config_file:
+        module = rss.RSSModule(config_file, 'http://localhost/rss', 'test')
+    source = await models.Source.create(slug_name='test')
+    paragraphs = [f'Абзац {index} новости о спорте.' for index in range(50)]
+    misc_data = {
+        'id': 'news-1', 'title': 'Новость', 'link': 'http://localhost/news',
+        'summary_detail': {'type': 'text/plain', 'value': 'Текст'}
+    }
+    for index in range(3):
+        await models.Article.create(
+            source=source, slug_name=f'news-{index}', title='Новость',
+            source_url='http://localhost/news', misc_data=misc_data,
+            wikitext_paragraphs=paragraphs if index != 2 else None
+        )
+
+    PARAGRAPHS_CODEC.set_compression('zlib')
+    try:
+        old_size, new_size = await compact_db_async(
+            module, chunk_size=2, show_progress=False
+        )
+        assert new_size < old_size / 2
+        rows = await tortoise.Tortoise.get_connection(
+            'default'
+        ).execute_query_dict('SELECT wikitext_paragraphs FROM article')
+        assert rows[0]['wikitext_paragraphs'].startswith('"zlib:')
+        assert rows[2]['wikitext_paragraphs'] is None
+        articles = await models.Article.all().order_by('article_id')
+        assert articles[0].wikitext_paragraphs == paragraphs
+        assert articles[0].misc_data == {'id': 'news-1'}
+        assert await compact_db_async(
+            module, show_progress=False
+        ) == (new_size, new_size)
+    finally:
+        PARAGRAPHS_CODEC.set_compression('none')
+
+    # Compressed values are decoded when compression is disabled
+    assert await models.Article.filter(
+        wikitext_paragraphs__not_isnull=True
+    ).values_list('wikitext_paragraphs') == [(paragraphs,)] * 2
+    with pytest.raises(ValueError, match='Invalid'):
+        PARAGRAPHS_CODEC.set_compression('lzma')
+
+
+@pytest.mark.asyncio
+async def test_rss_generate_wiki_pages_incremental(
+    tmp_path: pathlib.Path
+) -> None:
+    with open('data/test/rss.json', mode='rt') as config_file:
+        module = rss.RSSModule(config_file, 'http://localhost/rss', 'test')
+    source = await models.Source.create(slug_name='test')
+    article = await models.Article.create(
+        source=source, slug_name='news', title='Новость',
+        source_url='http://localhost/news', date='2022-07-03T06:11:11+00:00',
+        misc_data={}, wikitext_paragraphs=['Текст.']
+    )
+    page_file_path = tmp_path / 'news.txt'
+
+    async def generate(force: bool = False) -> Any:
+        with open(tmp_path / 'pages.json', mode='wt') as output_file:
+            await generate_wiki_pages_async(
+                module, 'TestBot', tmp_path, output_file, force=force
+            )
+        with open(tmp_path / 'pages.json', mode='rt') as output_file:
+            return json.load(output_file)
+
+    await generate()
+    assert '{{Категории|}}' in page_file_path.read_text()
+
+    page_file_path.write_text('not changed')
+    assert list(await generate()) == ['news']
+    assert page_file_path.read_text() == 'not changed'
+
+    tag = await models.Tag.create(title='Тег')
+    await models.ArticleTag.create(article=article, tag=tag)
+    await generate()
+    assert '{{Категории|Тег}}' in page_file_path.read_text()
+
+    page_file_path.write_text('not changed')
+    await generate(force=True)
+    assert '{{Категории|Тег}}' in page_file_path.read_text()
+
+    page_file_path.unlink()
+    await generate()
+    assert page_file_path.exists()
+
+
+class PagedMockModule(SourceModule):
+    """Source module with 3 news per page, page 1 is most recent."""
+
+    source_slug_name = 'paged'
+    page_count: int
+    fetched_pages: List[int]
+    failed_pages: Container[int]
+
+    def __init__(self, page_count: int):
+        self.page_count = page_count
+        self.fetched_pages = []
+        self.failed_pages = frozenset()
+
+    async def fetch_news(
+        self, session: aiohttp.ClientSession, page: int, source: models.Source,
+        known_slug_names: Container[str] = frozenset()
+    ) -> Tuple[Iterable[models.Article], Dict[str, Set[str]]]:
+        self.fetched_pages.append(page)
+        if page in self.failed_pages:
+            raise HTTPStatusError(500)
+        articles: List[models.Article] = []
+        if page > self.page_count:
+            return articles, {}
+        for index in range(3):
+            slug_name = f'news-{(self.page_count - page) * 3 + index}'
+            if slug_name in known_slug_names:
+                continue
+            articles.append(models.Article(
+                source=source, slug_name=slug_name, title=slug_name,
+                source_url=f'http://localhost/{slug_name}', misc_data={}
+            ))
+        return articles, {
+            article.slug_name: {'Tag'} for article in articles
+        }
+
+    def extract_article(self, source_url: str, html: str) -> ArticleContent:
+        raise NotImplementedError()
+
+    def render_wiki_page_text(
+        self, article: models.RenderedArticle, bot_name: str,
+        tag_titles: Iterable[str]
+    ) -> Optional[str]:
+        raise NotImplementedError()
+
+
+@pytest.mark.asyncio
+async def test_fetch_news_known_articles() -> None:
+    module = PagedMockModule(3)
+    await fetch_news_async(module, 2, 3)
+    assert module.fetched_pages == [3, 2]
+
+    module.page_count = 5
+    module.fetched_pages = []
+    await fetch_news_async(module, 1, 10, early_stop=True)
+    # Pages 1 and 2 are new, page 3 is known (it was page 1 before), page 4
+    # may be requested before page 3 is checked
+    assert module.fetched_pages[:3] == [1, 2, 3]
+    assert max(module.fetched_pages) <= 4
+    slug_names = await models.Article.all().order_by(
+        'article_id'
+    ).values_list('slug_name')
+    assert slug_names == [(f'news-{index}',) for index in range(15)]
+    assert await models.ArticleTag.all().count() == 15
+
+    module.fetched_pages = []
+    await fetch_news_async(module, 1, 2, concurrency=2)
+    assert await models.Article.all().count() == 15
+
+
+@pytest.mark.asyncio
+async def test_fetch_news_resume() -> None:
+    module = PagedMockModule(5)
+    module.failed_pages = {3}
+    with pytest.raises(HTTPStatusError):
+        await fetch_news_async(
+            module, 1, 5,
+            retry_policy=RetryPolicy(attempts=2, base_delay=0.01)
+        )
+    assert module.fetched_pages.count(3) == 2
+    assert await models.Article.all().count() == 6
+    assert set(await models.CompletedPage.all().values_list(
+        'page'
+    )) == {(4,), (5,)}
+
+    module.failed_pages = frozenset()
+    module.fetched_pages = []
+    await fetch_news_async(module, 1, 5, resume=True)
+    assert module.fetched_pages == [3, 2, 1]
+    assert await models.Article.all().count() == 15
+    assert await models.CompletedPage.all().count() == 0
+
+
+@pytest.mark.asyncio
+async def test_retry_policy() -> None:
+    call_count = 0
+
+    async def request(status: int, failed_count: int) -> int:
+        nonlocal call_count
+        call_count += 1
+        if call_count <= failed_count:
+            raise HTTPStatusError(status)
+        return status
+
+    retry_policy = RetryPolicy(attempts=3, base_delay=0.01)
+    assert await retry_policy.run(lambda: request(503, 2)) == 503
+    assert call_count == 3
+
+    call_count = 0
+    with pytest.raises(HTTPStatusError):
+        await retry_policy.run(lambda: request(500, 3))
+    assert call_count == 3
+
+    # Client errors are not retried
+    call_count = 0
+    with pytest.raises(HTTPStatusError):
+        await retry_policy.run(lambda: request(403, 1))
+    assert call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_download_article_transient_errors() -> None:
+    # Server drops connection twice, then returns page
+    connection_count = 0
+
+    async def handle_connection(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        nonlocal connection_count
+        connection_count += 1
+        await reader.readuntil(b'\r\n\r\n')
+        if connection_count > 2:
+            writer.write(
+                b'HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n'
+                b'Content-Length: 4\r\nConnection: close\r\n\r\nText'
+            )
+            await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle_connection, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    with open('data/test/rss.json', mode='rt') as config_file:
+        module = rss.RSSModule(config_file, 'http://localhost/rss', 'test')
+    article = models.ArticleFetchRow(
+        1, f'http://127.0.0.1:{port}/news', None, None
+    )
+    retry_policy = RetryPolicy(attempts=3, base_delay=0.01)
+    async with server, aiohttp.ClientSession() as session:
+        with pytest.raises(aiohttp.ClientError):
+            await module.download_article(article, session)
+        assert article.source_url_ok is None
+
+        connection_count = 0
+        assert await retry_policy.run(functools.partial(
+            module.download_article, article, session
+        )) == 'Text'
+        assert connection_count == 3
+        assert article.source_url_ok is True
+
+        # Invalid URL is marked as incorrect
+        article = models.ArticleFetchRow(1, 'http://[invalid/news', None, None)
+        assert await module.download_article(article, session) is None
+        assert article.source_url_ok is False
+
+
+@pytest.mark.asyncio
+async def test_map_ordered() -> None:
+    running = 0
+    max_running = 0
+
+    async def delayed_square(value: int) -> int:
+        nonlocal running, max_running
+        running += 1
+        max_running = max(max_running, running)
+        await asyncio.sleep((10 - value) * 0.001)
+        running -= 1
+        return value * value
+
+    results: List[int] = []
+    async for result in map_ordered(delayed_square, range(10), 3):
+        results.append(result)
+
+    assert results == [value * value for value in range(10)]
+    assert max_running == 3
+
+
+@pytest.mark.asyncio
+async def test_article_write_buffer() -> None:
+    source = await models.Source.create(slug_name='test')
+    await models.Article.bulk_create([
+        models.Article(
+            source=source, slug_name=f'news-{index}', title='Title',
+            source_url=f'http://localhost/news/{index}', misc_data={}
+        )
+        for index in range(5)
+    ])
+    rows = [
+        models.ArticleFetchRow(*values)
+        for values in await models.Article.all().order_by(
+            'article_id'
+        ).values_list(*models.ArticleFetchRow.FIELD_NAMES)
+    ]
+    for index, row in enumerate(rows):
+        row.source_url_ok = True
+        row.author_name = f"Author's name {index}"
+        row.wikitext_paragraphs = [f"'''Text''' {index}"]
+
+    async def get_saved_count() -> int:
+        return await models.Article.filter(source_url_ok=True).count()
+
+    fields = ['source_url_ok', 'author_name', 'wikitext_paragraphs']
+    async with ArticleWriteBuffer(fields, 2, 0.05) as write_buffer:
+        await write_buffer.add(rows[0])
+        assert await get_saved_count() == 0
+        await write_buffer.add(rows[1])
+        assert await get_saved_count() == 2
+        await write_buffer.add(rows[2])
+        await asyncio.sleep(0.2)
+        assert await get_saved_count() == 3
+
+    async def add_and_wait() -> None:
+        async with ArticleWriteBuffer(fields, 10, 10) as write_buffer:
+            await write_buffer.add(rows[3])
+            await write_buffer.add(rows[4])
+            await asyncio.sleep(10)
+
+    task = asyncio.ensure_future(add_and_wait())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert await get_saved_count() == 5
+
+    articles = await models.Article.all().order_by('article_id')
+    assert articles[4].author_name == "Author's name 4"
+    assert articles[4].wikitext_paragraphs == ["'''Text''' 4"]
+
+
+def test_parse_retry_after() -> None:
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after('invalid') is None
+    delay = parse_retry_after(
+        email.utils.formatdate(time.time() + 60, usegmt=True)
+    )
+    assert (delay is not None) and (0 < delay <= 60)
+
+
+def test_normalize_entry_dates(monkeypatch: pytest.MonkeyPatch) -> None:
+    import feedparser
+    parsed_feed = feedparser.parse(
+        '<rss version="2.0"><channel><item><title>Новость</title>'
+        '<pubDate>Sun, 03 Jul 2022 09:11:11 +0300</pubDate></item>'
+        '<item><title>Без даты</title></item></channel></rss>'
+    )
+    # Result does not depend on local timezone
+    monkeypatch.setenv('TZ', 'Asia/Vladivostok')
+    time.tzset()
+    try:
+        rss.normalize_entry_dates(parsed_feed.entries)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+    entry, entry_without_date = parsed_feed.entries
+    date = datetime.datetime(
+        2022, 7, 3, 6, 11, 11, tzinfo=datetime.timezone.utc
+    )
+    assert entry['published_datetime'] == date
+    assert 'published_datetime' not in entry_without_date
+    json_dict = rss.entry_to_json_dict(entry)
+    assert json_dict['published_parsed'] == '2022-07-03T06:11:11+00:00'
+    assert 'published_datetime' not in json_dict
+    json.dumps(json_dict)
+
+
+@pytest.mark.asyncio
+async def test_host_rate_limiter(
+    aiohttp_server: Callable[
+        [aiohttp.web.Application], Awaitable[aiohttp.test_utils.TestServer]
+    ]
+) -> None:
+    throttled_count = 1
+
+    async def get_page(request: aiohttp.web.Request) -> aiohttp.web.Response:
+        nonlocal throttled_count
+        if request.path == '/throttled' and throttled_count > 0:
+            throttled_count -= 1
+            return aiohttp.web.Response(
+                status=429, headers={'Retry-After': '1'}
+            )
+        return aiohttp.web.Response(text='text')
+
+    app = aiohttp.web.Application()
+    app.router.add_route('*', '/{name}', get_page)
+    server = await aiohttp_server(app)
+    base_url = f'http://{server.host}:{server.port}'
+
+    rate_limiter = HostRateLimiter(initial_rate=20, rate_step=1)
+    async with SessionFactory(
+        rate_limiter=rate_limiter
+    ).create_session() as session:
+        async def get_status(path: str) -> int:
+            async with session.get(base_url + path) as response:
+                return response.status
+
+        start_time = time.monotonic()
+        assert await asyncio.gather(*(get_status('/ok') for _ in range(5))) \
+            == [200] * 5
+        assert time.monotonic() - start_time >= 0.15
+        assert rate_limiter.get_rate(base_url) == 25
+
+        assert await get_status('/throttled') == 429
+        assert rate_limiter.get_rate(base_url) == 12.5
+        start_time = time.monotonic()
+        assert await get_status('/throttled') == 200
+        assert time.monotonic() - start_time >= 0.9
+
+        # Throttled response does not mark URL as incorrect
+        throttled_count = 1
+        article = models.ArticleFetchRow(
+            1, base_url + '/throttled', None, None
+        )
+        with pytest.raises(ValueError):
+            await PagedMockModule(1).download_article(article, session)
+        assert article.source_url_ok is None
+
+
+@pytest.mark.asyncio
+async def test_session_factory(
+    aiohttp_server: Callable[
+        [aiohttp.web.Application], Awaitable[aiohttp.test_utils.TestServer]
+    ]
+) -> None:
+    async def get_page(request: aiohttp.web.Request) -> aiohttp.web.Response:
+        return aiohttp.web.Response(
+            text=request.headers.get('Accept-Encoding', '')
+        )
+
+    app = aiohttp.web.Application()
+    app.router.add_route('GET', '/', get_page)
+    server = await aiohttp_server(app)
+
+    config = SessionConfig.from_json_dict({
+        'limit_per_host': 2, 'dns_cache_ttl': None, 'total_timeout': 10,
+        'accept_encoding': 'identity'
+    })
+    assert config.limit_per_host == 2
+    assert config.keepalive_timeout == SessionConfig().keepalive_timeout
+    async with SessionFactory(config).create_session(1) as session:
+        assert session.connector is not None
+        assert session.connector.limit_per_host == 1
+        async with session.get(
+            f'http://{server.host}:{server.port}/'
+        ) as response:
+            assert await response.text() == 'identity'
+
+    with pytest.raises(ValueError, match='Unknown'):
+        SessionConfig.from_json_dict({'limit_per_ip': 1})
+    with pytest.raises(ValueError, match='Invalid'):
+        SessionConfig.from_json_dict({'limit': True})
+
+
+@pytest.mark.parametrize('backend_name', list(PARSER_BACKEND_CREATORS))
+def test_parser_backends(backend_name: str) -> None:
+    try:
+        backend = get_parser_backend(backend_name)
+    except ValueError as exc:
+        pytest.skip(str(exc))
+    reference_backend = get_parser_backend('html.parser')
+
+    for _, html, css_selector in load_corpus(
+        pathlib.Path('data/test/pages')
+    ):
+        assert extract_paragraphs(backend, html, css_selector) == (
+            extract_paragraphs(reference_backend, html, css_selector)
+        )
+
+
+def test_parser_backend_not_installed(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setitem(sys.modules, 'lxml.html', None)
+    with pytest.raises(ValueError, match='lxml is not installed'):
+        get_parser_backend('bs4-lxml')
+
+
+def generate_random_html(rng: random.Random, depth: int) -> str:
+    texts = ['text', ' ', '\n', 'текст &amp; ', '', '  \n  ', '<!-- c -->']
+    parts: List[str] = []
+    for _ in range(rng.randint(0, 4)):
+        kind = rng.choice([
+            'text', 'text', 'a', 'a', 'b', 'strong', 'br', 'img', 'script',
+            'span', 'i'
+        ])
+        if kind == 'text' or depth == 0:
+            parts.append(rng.choice(texts))
+        elif kind in ('br', 'img'):
+            parts.append(f'<{kind}>')
+        elif kind == 'script':
+            parts.append('<script>var a = "<b>";</script>')
+        elif kind == 'a':
+            href = rng.choice(['/news/1', 'http://example.com/', 'invalid'])
+            content = generate_random_html(rng, depth - 1)
+            parts.append(f'<a href="{href}">{content}</a>')
+        else:
+            content = generate_random_html(rng, depth - 1)
+            parts.append(f'<{kind}>{content}</{kind}>')
+    return ''.join(parts)
+
+
+@pytest.mark.parametrize('seed', range(20))
+@pytest.mark.parametrize('disable_bold_font', [False, True])
+def test_html_to_wikitext(seed: int, disable_bold_font: bool) -> None:
+    def link_handler(href: str) -> str:
+        if href == 'invalid':
+            raise ValueError(href)
+        return 'https://example.com' + href
+
+    rng = random.Random(seed)
+    backend = get_parser_backend('html.parser')
+    for _ in range(20):
+        html = f'<p>{generate_random_html(rng, 5)}</p>'
+        element = backend.select(backend.parse(html), 'p')[0]
+        assert html_to_wikitext(
+            element, link_handler, disable_bold_font=disable_bold_font
+        ) == html_to_wikitext_recursive(
+            element, link_handler, disable_bold_font=disable_bold_font
+        )
+
+
+def test_html_to_wikitext_deep() -> None:
+    depth = 5000
+    backend = get_parser_backend('html.parser')
+    element = backend.select(
+        backend.parse('<p>' + '<b>a' * depth + '</b>' * depth + '</p>'), 'p'
+    )[0]
+    assert html_to_wikitext(element, lambda href: href) == (
+        "'''a" * depth + "'''" * depth
+    )
+
+
+def run_cli_with_importtime(
+    args: List[str], db_url: str
+) -> Tuple[Set[str], float]:
+    """
+    Run command line in new process with `-X importtime`.
+
+    Return names of imported top-level packages and total import time in
+    seconds.
+    """
+    result = subprocess.run(
+        [
+            sys.executable, '-X', 'importtime',
+            str(pathlib.Path(__file__).parent.joinpath('news_fetcher.py')),
+            *args
+        ],
+        capture_output=True, text=True, check=True,
+        env=dict(os.environ, DATABASE_URL=db_url)
+    )
+    package_names: Set[str] = set()
+    import_time = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_time, name = line.split('|')
+        package_names.add(name.strip().split('.')[0])
+        if not name.startswith('  '):
+            import_time += int(cumulative_time)
+    return package_names, import_time / 1000000
+
+
+@pytest.mark.parametrize('command', ['--help', 'mark-uploaded-pages'])
+def test_cli_cold_start(command: str, tmp_path: pathlib.Path) -> None:
+    db_url = f'sqlite://{tmp_path}/test.sqlite3'
+    input_file_path = tmp_path.joinpath('pages.json')
+    with open(input_file_path, mode='wt') as input_file:
+        json.dump({'news-1': {}}, input_file)
+    run_cli_with_importtime(['init-db'], db_url)
+
+    args = ['--source-module', 'prostoprosport', '--source-path', 'news']
+    if command == '--help':
+        args.append(command)
+    else:
+        args += [command, '--input-file', str(input_file_path)]
+    package_names, import_time = run_cli_with_importtime(args, db_url)
+
+    # Parser, HTTP and RSS libraries take most of import time, and these
+    # commands do not need them
+    for package_name in ('aiohttp', 'bs4', 'feedparser', 'lxml'):
+        assert package_name not in package_names
+    if command == '--help':
+        assert 'tortoise' not in package_names
+    assert import_time < 2.0
+
+
 # TODO: test other methods
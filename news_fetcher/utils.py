@@ -1,7 +1,9 @@
 """Utilitary functions."""
 import datetime
+import json
 import time
-from typing import Dict, List, Optional
+import types
+from typing import Dict, List, Optional, TextIO, Type
 
 
 def check_str(data: object) -> str:
@@ -68,4 +70,57 @@ def check_list_dict_str_object(data: object) -> List[Dict[str, object]]:
 
 
 def struct_time_to_datetime(value: time.struct_time) -> datetime.datetime:
-    return datetime.datetime.fromtimestamp(time.mktime(value))
+    """
+    Convert `struct_time` in UTC to timezone-aware `datetime`.
+
+    Dates parsed by feedparser are in UTC. Leap second is replaced with
+    last second of minute.
+    """
+    return datetime.datetime(
+        value[0], value[1], value[2], value[3], value[4], min(value[5], 59),
+        tzinfo=datetime.timezone.utc
+    )
+
+
+class JSONObjectWriter:
+    """
+    Writer for JSON object that is written to file item by item.
+
+    Output is the same as output of `json.dump` with `indent` parameter, but
+    the whole object is not kept in memory.
+    """
+
+    file: TextIO
+    indent: int
+    item_count: int
+
+    def __init__(self, file: TextIO, indent: int = 4):
+        self.file = file
+        self.indent = indent
+        self.item_count = 0
+
+    def __enter__(self) -> 'JSONObjectWriter':
+        self.file.write('{')
+        return self
+
+    def write_item(self, key: str, value: object) -> None:
+        """Write key and value of JSON object item."""
+        padding = ' ' * self.indent
+        value_str = json.dumps(
+            value, ensure_ascii=False, indent=self.indent
+        ).replace('\n', '\n' + padding)
+        if self.item_count != 0:
+            self.file.write(',')
+        self.file.write(
+            f'\n{padding}{json.dumps(key, ensure_ascii=False)}: {value_str}'
+        )
+        self.item_count += 1
+
+    def __exit__(
+        self, exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[types.TracebackType]
+    ) -> None:
+        if self.item_count != 0:
+            self.file.write('\n')
+        self.file.write('}')
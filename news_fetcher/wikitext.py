@@ -1,38 +1,53 @@
 """Wikitext conversion functions."""
-from typing import Callable
+from typing import Any, Callable, Iterator, List, Optional, Tuple
 
-import bs4
+from parsers import BeautifulSoupBackend, ParserBackend
+
+DEFAULT_BACKEND = BeautifulSoupBackend('html.parser', 'html.parser')
 
 
 def html_to_wikitext(
-    element: bs4.element.PageElement, link_handler: Callable[[str], str],
-    disable_bold_font: bool = False
+    element: Any, link_handler: Callable[[str], str],
+    disable_bold_font: bool = False,
+    backend: ParserBackend = DEFAULT_BACKEND
 ) -> str:
-    """Convert HTML element to wiki-text recursively."""
-    if isinstance(element, bs4.element.NavigableString):
-        return str(element.string)
-    if isinstance(element, bs4.element.Tag):
-        content_str = ''.join(list(map(
-            lambda e:
-            html_to_wikitext(
-                e, link_handler, disable_bold_font=disable_bold_font
-            ),
-            element.children
-        )))
-        if element.name == 'a':
-            href = element.attrs['href']
-            try:
-                url = link_handler(href)
-            except ValueError:
-                return content_str
-            return f'[{url} {content_str}]'
-        elif (element.name in ('b', 'strong')) and not disable_bold_font:
-            return f"'''{content_str}'''"
-        elif element.name == 'br':
-            return '<br />'
-        elif element.name in ('script', 'img'):
-            return ''
+    """
+    Convert HTML element to wiki-text.
+
+    Element should be node of parser backend, BeautifulSoup is used
+    by default. Tree is traversed without recursion, wiki-text is written to
+    single list of strings.
+    """
+    output: List[str] = []
+    # Stack of iterators over child nodes with text to write after children
+    stack: List[Tuple[Iterator[Any], str]] = []
+    node: Optional[Any] = element
+    while True:
+        tag_name = backend.get_tag_name(node)
+        if tag_name is None:
+            output.append(backend.get_string(node))
+        elif tag_name == 'br':
+            output.append('<br />')
+        elif tag_name not in ('script', 'img'):
+            suffix = ''
+            if tag_name == 'a':
+                href = backend.get_attribute(node, 'href')
+                try:
+                    url = link_handler(href)
+                except ValueError:
+                    pass
+                else:
+                    output.append(f'[{url} ')
+                    suffix = ']'
+            elif (tag_name in ('b', 'strong')) and not disable_bold_font:
+                output.append("'''")
+                suffix = "'''"
+            stack.append((iter(backend.get_children(node)), suffix))
+
+        while len(stack) != 0:
+            node = next(stack[-1][0], None)
+            if node is not None:
+                break
+            output.append(stack.pop()[1])
         else:
-            return content_str
-    else:
-        raise TypeError(element)
+            return ''.join(output)
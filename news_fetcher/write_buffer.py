@@ -0,0 +1,157 @@
+"""Write-behind buffer for article updates."""
+import asyncio
+import types
+from typing import Dict, List, Optional, Sequence, Type
+
+import tortoise
+
+import models
+
+
+def get_update_sql(field_names: Sequence[str], dialect: str) -> str:
+    """Get parametrized SQL statement to update article fields by ID."""
+    placeholders = [
+        f'${index + 1}' if dialect == 'postgres' else '?'
+        for index in range(len(field_names) + 1)
+    ]
+    fields_map = models.Article._meta.fields_map
+    column_names = [
+        fields_map[field_name].source_field or field_name
+        for field_name in field_names
+    ]
+    assignments = ', '.join(
+        f'"{column_name}" = {placeholder}'
+        for column_name, placeholder in zip(column_names, placeholders)
+    )
+    return (
+        f'UPDATE "{models.Article._meta.db_table}" SET {assignments} '
+        f'WHERE "article_id" = {placeholders[-1]}'
+    )
+
+
+def get_db_values(
+    field_names: Sequence[str], values: Dict[str, object]
+) -> List[object]:
+    """Convert article field values to values for SQL statement."""
+    fields_map = models.Article._meta.fields_map
+    return [
+        fields_map[field_name].to_db_value(
+            values[field_name], models.Article
+        )
+        for field_name in field_names
+    ]
+
+
+async def save_stored_pages(page_hashes_by_article_id: Dict[int, str]) -> None:
+    """Link articles to content hashes of their pages in page store."""
+    async with tortoise.transactions.in_transaction():
+        await models.StoredPage.filter(
+            article_id__in=list(page_hashes_by_article_id)
+        ).delete()
+        await models.StoredPage.bulk_create([
+            models.StoredPage(article_id=article_id, content_hash=page_hash)
+            for article_id, page_hash in page_hashes_by_article_id.items()
+        ])
+
+
+class ArticleWriteBuffer:
+    """
+    Buffer which collects article field updates and saves them in bulk.
+
+    Values of `field_names` fields are saved with bulk update queries in one
+    transaction when `max_size` articles are collected, and every
+    `max_delay` seconds if buffer is used as asynchronous context manager.
+    Updates are saved with one parametrized statement executed for all
+    articles. Content hashes of pages stored in page store are saved in the
+    same transaction (see `StoredPage` model).
+    All collected updates are saved when context manager exits, even if it
+    exits because of exception or cancellation (e.g. on Ctrl-C).
+    """
+
+    field_names: List[str]
+    max_size: int
+    max_delay: float
+    values_by_article_id: Dict[int, Dict[str, object]]
+    page_hashes_by_article_id: Dict[int, str]
+    lock: asyncio.Lock
+    flush_task: Optional['asyncio.Task[None]']
+
+    def __init__(
+        self, field_names: Sequence[str], max_size: int = 50,
+        max_delay: float = 1.0
+    ):
+        self.field_names = list(field_names)
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.values_by_article_id = {}
+        self.page_hashes_by_article_id = {}
+        self.lock = asyncio.Lock()
+        self.flush_task = None
+
+    async def __aenter__(self) -> 'ArticleWriteBuffer':
+        self.flush_task = asyncio.ensure_future(self.flush_periodically())
+        return self
+
+    async def __aexit__(
+        self, exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[types.TracebackType]
+    ) -> None:
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+            self.flush_task = None
+        await self.flush()
+
+    async def add(
+        self, article: models.FetchedArticle, page_hash: Optional[str] = None
+    ) -> None:
+        """
+        Add article field values to buffer, flush if buffer is full.
+
+        `page_hash` is content hash of stored article page, if any.
+        """
+        self.values_by_article_id[article.article_id] = {
+            field_name: getattr(article, field_name)
+            for field_name in self.field_names
+        }
+        if page_hash is not None:
+            self.page_hashes_by_article_id[article.article_id] = page_hash
+        if len(self.values_by_article_id) >= self.max_size:
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Save all collected updates in one transaction."""
+        async with self.lock:
+            if len(self.values_by_article_id) == 0:
+                return
+            # Updates are removed from buffer only after they are saved, so
+            # they are not lost if flush is cancelled
+            values_by_article_id = dict(self.values_by_article_id)
+            page_hashes_by_article_id = dict(self.page_hashes_by_article_id)
+            async with tortoise.transactions.in_transaction() as connection:
+                await connection.execute_many(
+                    get_update_sql(
+                        self.field_names, connection.capabilities.dialect
+                    ),
+                    [
+                        get_db_values(self.field_names, values) + [article_id]
+                        for article_id, values in values_by_article_id.items()
+                    ]
+                )
+                if len(page_hashes_by_article_id) != 0:
+                    await save_stored_pages(page_hashes_by_article_id)
+            for article_id, values in values_by_article_id.items():
+                if self.values_by_article_id.get(article_id) is values:
+                    del self.values_by_article_id[article_id]
+            for article_id, page_hash in page_hashes_by_article_id.items():
+                if self.page_hashes_by_article_id.get(article_id) == page_hash:
+                    del self.page_hashes_by_article_id[article_id]
+
+    async def flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.max_delay)
+            await self.flush()
@@ -9,14 +9,17 @@ trap 'rm -rf -- "$TMP_DIRECTORY"' EXIT
 
 poetry run python ./news_fetcher/news_fetcher.py --source-module rss --data-file "$DATA_FILE" --source-path "$SOURCE_PATH" --source-name "$SOURCE_NAME" fetch-news
 poetry run python ./news_fetcher/news_fetcher.py --source-module rss --data-file "$DATA_FILE" --source-path "$SOURCE_PATH" --source-name "$SOURCE_NAME" fetch-news-pages
-mkdir "$TMP_DIRECTORY/pages"
-poetry run python ./news_fetcher/news_fetcher.py --source-module rss --data-file "$DATA_FILE" --source-path "$SOURCE_PATH" --source-name "$SOURCE_NAME" generate-wiki-pages --output-file "$TMP_DIRECTORY/pages.json" --output-directory "$TMP_DIRECTORY/pages" --bot-name "$BOT_NAME"
+PAGES_DIRECTORY="${PAGES_DIRECTORY:-data1/pages}"
+mkdir -p "$PAGES_DIRECTORY"
+# Path should be absolute, because upload step runs in other directory
+PAGES_DIRECTORY="$(cd "$PAGES_DIRECTORY" && pwd)"
+poetry run python ./news_fetcher/news_fetcher.py --source-module rss --data-file "$DATA_FILE" --source-path "$SOURCE_PATH" --source-name "$SOURCE_NAME" generate-wiki-pages --output-file "$TMP_DIRECTORY/pages.json" --output-directory "$PAGES_DIRECTORY" --bot-name "$BOT_NAME"
 
 CURRENT_DIRECTORY="$(pwd)"
 
 cd "$WIKI_TOOL_DIRECTORY"
 
-poetry run python ./wiki_tool_python/wikitool.py --requests-interval "$REQUESTS_INTERVAL" upload-pages "$TARGET_API_URL" "$TMP_DIRECTORY/pages" "$TMP_DIRECTORY/pages.json" --prefix "$WIKI_PREFIX" --dictionary --extended-dictionary --mode overwrite
+poetry run python ./wiki_tool_python/wikitool.py --requests-interval "$REQUESTS_INTERVAL" upload-pages "$TARGET_API_URL" "$PAGES_DIRECTORY" "$TMP_DIRECTORY/pages.json" --prefix "$WIKI_PREFIX" --dictionary --extended-dictionary --mode overwrite
 
 cd "$CURRENT_DIRECTORY"
 